@@ -0,0 +1,199 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from .memory import MemoryBudget, estimate_size
+from .models import ReportTable
+
+# Parameters that never influence the content of a report
+IGNORED_PARAMS = {'module', 'format', 'token_auth'}
+
+
+def make_cache_key(method: str, params: Dict[str, Any]) -> str:
+    """Build a cache key from an API method and its (canonical) parameters."""
+    relevant = {
+        k: str(v) for k, v in params.items()
+        if k not in IGNORED_PARAMS and v is not None
+    }
+    return method + '?' + json.dumps(relevant, sort_keys=True)
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache for Matomo API responses with a time-to-live.
+
+    Entries are keyed with :func:`make_cache_key`, so requests differing
+    only in parameter order or in the spelling of an equivalent segment
+    share one entry. Expired entries are kept until evicted so that they can
+    be revalidated with the ETag/Last-Modified validators stored alongside.
+
+    Flat reports are stored column-wise as :class:`ReportTable`, shared
+    as is with callers asking for tables and expanded into new row dicts
+    for all others. The estimated size of every entry is accounted
+    for, both against ``max_bytes`` and in the server's memory budget.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_entries: int = 1000,
+        max_bytes: int = 0,
+        budget: Optional[MemoryBudget] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Seconds an entry stays valid
+            max_entries: Maximum number of entries before the least
+                recently used ones are evicted
+            max_bytes: Maximum estimated size of all entries, 0 for no limit
+            budget: Memory budget the entries are charged to; the cache
+                evicts entries when the budget is exceeded
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.budget = budget
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        # key -> (stored at, value, validators, size)
+        self._entries: "OrderedDict[str, Tuple[float, Any, Optional[Dict[str, str]], int]]" = OrderedDict()
+        if budget is not None:
+            budget.add_reclaimer(self.shrink)
+            budget.add_holder(self.held_ids)
+
+    def get(self, key: str, as_table: bool = False) -> Tuple[bool, Any]:
+        """
+        Look up a key.
+
+        Args:
+            key: Cache key
+            as_table: Return flat reports as the stored table instead of rows
+
+        Returns:
+            ``(True, value)`` for a fresh entry, ``(False, None)`` otherwise
+        """
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, _expand(entry[1], as_table)
+
+    def validators(self, key: str) -> Optional[Dict[str, str]]:
+        """Return the validators of an entry, fresh or expired, if it has any."""
+        entry = self._entries.get(key)
+        return entry[2] if entry is not None else None
+
+    def revalidate(self, key: str, as_table: bool = False) -> Tuple[bool, Any]:
+        """
+        Mark an entry confirmed unchanged (HTTP 304) as fresh and return it.
+
+        Returns:
+            ``(True, value)``, or ``(False, None)`` if the entry was evicted
+            while the conditional request was in flight
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        _, value, validators, size = entry
+        self._entries[key] = (time.monotonic(), value, validators, size)
+        self._entries.move_to_end(key)
+        self.revalidations += 1
+        return True, _expand(value, as_table)
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        validators: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Store a value, evicting the least recently used entries if full."""
+        stored = value if isinstance(value, ReportTable) else ReportTable.from_rows(value) or value
+        size = estimate_size(stored)
+        self._discard(key)
+        self._entries[key] = (time.monotonic(), stored, validators, size)
+        self._account(size)
+
+        while len(self._entries) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes):
+            self._evict()
+        if self.budget is not None:
+            self.budget.reclaim()
+
+    def shrink(self, nbytes: int) -> int:
+        """
+        Evict least recently used entries until ``nbytes`` are freed.
+
+        Returns:
+            The number of bytes freed
+        """
+        freed = 0
+        while self._entries and freed < nbytes:
+            freed += self._evict()
+        return freed
+
+    def held_ids(self) -> Set[int]:
+        """Return the IDs of the stored values and of the columns of stored tables."""
+        held: Set[int] = set()
+        for _, value, _, _ in self._entries.values():
+            held.add(id(value))
+            if isinstance(value, ReportTable):
+                held.add(id(value.columns))
+                held.update(id(column) for column in value.columns.values())
+        return held
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        self._account(-self.bytes)
+        self._entries.clear()
+
+    def _account(self, size: int) -> None:
+        self.bytes += size
+        if self.budget is not None:
+            if size >= 0:
+                self.budget.add('cache', size)
+            else:
+                self.budget.remove('cache', -size)
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._account(-entry[3])
+
+    def _evict(self) -> int:
+        _, entry = self._entries.popitem(last=False)
+        self._account(-entry[3])
+        self.evictions += 1
+        return entry[3]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current size."""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'evictions': self.evictions,
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'hit_rate': round(self.hits / total, 3) if total else None,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+
+def _expand(value: Any, as_table: bool) -> Any:
+    return value.to_rows() if isinstance(value, ReportTable) and not as_table else value
@@ -1,28 +1,94 @@
-from typing import Any, Dict, Optional
-from urllib.parse import urljoin
+import asyncio
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urljoin
 
-import httpx
+from .cache import ResponseCache, make_cache_key
+from .compare import compare_reports, compare_totals, comparison_windows, site_today
+from .compression import (
+    ACCEPT_ENCODING,
+    TransferStats,
+    cache_validators,
+    conditional_headers,
+)
+from .memory import MemoryBudget, estimate_size
+from .models import ReportTable, to_model
+from .output import extract_rows
+from .segments import SegmentRegistry, canonicalize_segment
+from .transport import HttpxTransport, Transport
+
+# Modules whose responses change from one request to the next
+UNCACHED_MODULES = {'Live'}
+
+# Seconds goal definitions are reused before being fetched again
+GOAL_DEFINITIONS_TTL = 3600
+
+# Conversion metrics kept in joined goal reports
+GOAL_METRICS = (
+    'nb_conversions', 'nb_visits_converted', 'conversion_rate', 'revenue',
+    'items', 'avg_order_revenue',
+)
+
+# Reports whose subtables are loaded through a different method; all
+# others accept idSubtable on the report method itself
+SUBTABLE_METHODS = {
+    'Referrers.getWebsites': 'Referrers.getUrlsFromWebsiteId',
+    'Referrers.getSearchEngines': 'Referrers.getKeywordsFromSearchEngineId',
+    'Referrers.getKeywords': 'Referrers.getSearchEnginesFromKeywordId',
+    'Referrers.getCampaigns': 'Referrers.getKeywordsFromCampaignId',
+    'Referrers.getSocials': 'Referrers.getUrlsForSocial',
+}
+
+ECOMMERCE_ITEM_METHODS = {
+    'sku': 'Goals.getItemsSku',
+    'name': 'Goals.getItemsName',
+    'category': 'Goals.getItemsCategory',
+}
 
 
 class MatomoClient:
     """Client for interacting with the Matomo Reporting API."""
 
-    def __init__(self, base_url: str, token_auth: str):
+    def __init__(
+        self,
+        base_url: str,
+        token_auth: str,
+        timeout: float = 30.0,
+        cache: Optional[ResponseCache] = None,
+        segments: Optional[SegmentRegistry] = None,
+        transport: Optional[Transport] = None,
+        memory: Optional[MemoryBudget] = None
+    ):
         """
         Initialize the Matomo client.
 
         Args:
             base_url: Base URL of the Matomo instance
             token_auth: API authentication token
+            timeout: Timeout in seconds for a single API request
+            cache: Optional cache for responses of reporting methods
+            segments: Optional registry tracking segment usage
+            transport: Transport sending the HTTP requests, defaults to a
+                pooled httpx client
+            memory: Memory budget that response bodies and decoded results
+                are charged to
         """
         self.base_url = base_url.rstrip('/')
         self.token_auth = token_auth
+        self.timeout = timeout
+        self.cache = cache
+        self.segments = segments
+        self.transport = transport or HttpxTransport()
+        self.transfer = TransferStats()
+        self.memory = memory or MemoryBudget()
+        self._goal_definitions = ResponseCache(ttl=GOAL_DEFINITIONS_TTL)
         self.api_url = urljoin(self.base_url + '/', 'index.php')
 
     async def call_api(
         self,
         method: str,
-        params: Optional[Dict[str, Any]] = None
+        params: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        as_table: bool = False
     ) -> Any:
         """
         Make an API call to Matomo.
@@ -30,14 +96,18 @@ class MatomoClient:
         Args:
             method: API method name (e.g., 'SitesManager.getSiteFromId')
             params: Additional parameters for the API call
+            use_cache: Whether the response cache may be used
+            as_table: Return flat reports as the :class:`ReportTable` held
+                by the cache
 
         Returns:
             API response data
 
         Raises:
             httpx.HTTPError: If the request fails
+            MemoryLimitExceeded: If the response exceeds the call's memory budget
         """
-        query_params = {
+        query_params: Dict[str, Any] = {
             'module': 'API',
             'method': method,
             'format': 'JSON',
@@ -47,16 +117,94 @@ class MatomoClient:
         if params:
             query_params.update(params)
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(self.api_url, params=query_params)
-            response.raise_for_status()
+        # Equivalent segments share one canonical spelling for cache entries
+        # and statistics. Matomo matches archives by the exact string though,
+        # so it is sent the caller's spelling or that of a stored segment.
+        original_segment = query_params.pop('segment', '')
+        segment = canonicalize_segment(original_segment)
+        if segment:
+            query_params['segment'] = segment
+
+        site_id = query_params.get('idSite')
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+
+        cache = self.cache if use_cache and self._is_cacheable(method) else None
+        cache_key = None
+        if cache is not None:
+            cache_key = make_cache_key(method, query_params)
+            hit, cached = cache.get(cache_key, as_table)
+            if hit:
+                self._record_segment(segment, site_id, True)
+                return cached
+            # An expired entry with validators costs a 304 instead of a full report
+            headers.update(conditional_headers(cache.validators(cache_key)))
+
+        if segment:
+            query_params['segment'] = original_segment
+            if self.segments is not None:
+                query_params['segment'] = await self.segments.spelling(
+                    self, segment, original_segment, site_id
+                )
+
+        response = await self._get(query_params, headers)
+
+        if response.status_code == 304 and cache is not None and cache_key is not None:
+            hit, cached = cache.revalidate(cache_key, as_table)
+            if hit:
+                self._record_segment(segment, site_id, True)
+                return cached
+            # The entry was evicted while the request was in flight
+            response = await self._get(query_params, {'Accept-Encoding': ACCEPT_ENCODING})
+
+        response.raise_for_status()
+
+        # The body is held while decoding, the decoded result until the call ends
+        body_size = len(response.content)
+        self.memory.charge('responses', body_size)
+        try:
             data = response.json()
+            self.memory.charge('decoded', estimate_size(data))
+        finally:
+            self.memory.release('responses', body_size)
+
+        # Check for Matomo API errors
+        if isinstance(data, dict) and 'result' in data and data['result'] == 'error':
+            raise Exception(f"Matomo API error: {data.get('message', 'Unknown error')}")
+
+        self._record_segment(segment, site_id, False)
+        if as_table:
+            data = ReportTable.from_rows(data) or data
+        if cache is not None and cache_key is not None:
+            cache.set(cache_key, data, cache_validators(response.headers))
+
+        return data
+
+    async def _get(self, params: Dict[str, Any], headers: Dict[str, str]) -> Any:
+        """Send one request through the transport and record its transfer."""
+        try:
+            response = await self.transport.get(self.api_url, params, headers, self.timeout)
+        except asyncio.CancelledError:
+            # Cancelling the request closes its connection, so Matomo stops sending
+            self.transfer.aborted += 1
+            raise
+        self.transfer.record(response)
+        return response
 
-            # Check for Matomo API errors
-            if isinstance(data, dict) and 'result' in data and data['result'] == 'error':
-                raise Exception(f"Matomo API error: {data.get('message', 'Unknown error')}")
+    async def aclose(self) -> None:
+        """Close the underlying transport and its connections."""
+        await self.transport.aclose()
 
-            return data
+    @staticmethod
+    def _is_cacheable(method: str) -> bool:
+        """Only read-only reporting methods outside real-time modules are cached."""
+        module, _, action = method.partition('.')
+        return action.startswith('get') and module not in UNCACHED_MODULES
+
+    def _record_segment(self, segment: Optional[str], site_id: Any, cache_hit: bool) -> None:
+        if self.segments is None or not segment:
+            return
+        stats = self.segments.record(segment, site_id, cache_hit)
+        self.segments.schedule_registration(self, stats, site_id)
 
     async def get_site_info(self, site_id: int) -> Dict[str, Any]:
         """Get information about a specific site."""
@@ -66,82 +214,419 @@ class MatomoClient:
         self,
         site_id: int,
         period: str = 'day',
-        date: str = 'today'
-    ) -> Dict[str, Any]:
-        """Get visits summary for a site."""
-        return await self.call_api('VisitsSummary.get', {
+        date: str = 'today',
+        typed: bool = False
+    ) -> Any:
+        """Get visits summary for a site, as a VisitsSummary if ``typed``."""
+        data = await self.call_api('VisitsSummary.get', {
             'idSite': site_id,
             'period': period,
             'date': date
-        })
+        }, as_table=typed)
+        return to_model('VisitsSummary.get', data) if typed else data
 
     async def get_page_urls(
         self,
         site_id: int,
         period: str = 'day',
         date: str = 'today',
-        limit: int = 10
+        limit: int = 10,
+        typed: bool = False
     ) -> Any:
-        """Get most visited page URLs."""
-        return await self.call_api('Actions.getPageUrls', {
+        """Get most visited page URLs, as an ActionTable if ``typed``."""
+        data = await self.call_api('Actions.getPageUrls', {
             'idSite': site_id,
             'period': period,
             'date': date,
             'filter_limit': limit
-        })
+        }, as_table=typed)
+        return to_model('Actions.getPageUrls', data) if typed else data
 
     async def get_countries(
         self,
         site_id: int,
         period: str = 'day',
         date: str = 'today',
-        limit: int = 10
+        limit: int = 10,
+        typed: bool = False
     ) -> Any:
-        """Get visitor statistics by country."""
-        return await self.call_api('UserCountry.getCountry', {
+        """Get visitor statistics by country, as a CountryTable if ``typed``."""
+        data = await self.call_api('UserCountry.getCountry', {
             'idSite': site_id,
             'period': period,
             'date': date,
             'filter_limit': limit
-        })
+        }, as_table=typed)
+        return to_model('UserCountry.getCountry', data) if typed else data
 
     async def get_user_settings(
         self,
         site_id: int,
         period: str = 'day',
-        date: str = 'today'
+        date: str = 'today',
+        typed: bool = False
     ) -> Any:
-        """Get visitor browser and device information."""
-        return await self.call_api('DevicesDetection.getType', {
+        """Get visitor browser and device information, as a DeviceTable if ``typed``."""
+        data = await self.call_api('DevicesDetection.getType', {
             'idSite': site_id,
             'period': period,
             'date': date
-        })
+        }, as_table=typed)
+        return to_model('DevicesDetection.getType', data) if typed else data
 
     async def get_browsers(
         self,
         site_id: int,
         period: str = 'day',
-        date: str = 'today'
+        date: str = 'today',
+        typed: bool = False
     ) -> Any:
-        """Get visitor browser statistics."""
-        return await self.call_api('DevicesDetection.getBrowsers', {
+        """Get visitor browser statistics, as a DeviceTable if ``typed``."""
+        data = await self.call_api('DevicesDetection.getBrowsers', {
             'idSite': site_id,
             'period': period,
             'date': date
-        })
+        }, as_table=typed)
+        return to_model('DevicesDetection.getBrowsers', data) if typed else data
 
     async def get_referrers(
         self,
         site_id: int,
         period: str = 'day',
         date: str = 'today',
+        limit: int = 10,
+        typed: bool = False
+    ) -> Any:
+        """Get referrer information, as a ReferrerTable if ``typed``."""
+        data = await self.call_api('Referrers.getAll', {
+            'idSite': site_id,
+            'period': period,
+            'date': date,
+            'filter_limit': limit
+        }, as_table=typed)
+        return to_model('Referrers.getAll', data) if typed else data
+
+    async def bulk_request(
+        self,
+        requests: List[Tuple[str, Dict[str, Any]]],
+        use_cache: bool = True
+    ) -> List[Any]:
+        """
+        Run several API methods in one HTTP round-trip via API.getBulkRequest.
+
+        Args:
+            requests: ``(method, params)`` pairs
+            use_cache: Whether the combined response may be cached
+
+        Returns:
+            The responses, in the order of ``requests``
+
+        Raises:
+            Exception: If Matomo reports an error for any of the requests
+        """
+        urls = {}
+        for i, (method, params) in enumerate(requests):
+            query = {'method': method, **params}
+            if query.get('segment'):
+                query['segment'] = canonicalize_segment(query['segment'])
+            urls[f'urls[{i}]'] = urlencode({k: v for k, v in query.items() if v is not None})
+
+        results = await self.call_api('API.getBulkRequest', urls, use_cache=use_cache)
+        for result in results:
+            if isinstance(result, dict) and result.get('result') == 'error':
+                raise Exception(f"Matomo API error: {result.get('message', 'Unknown error')}")
+        return results
+
+    async def get_goals(self, site_id: int) -> List[Dict[str, Any]]:
+        """Get the goal definitions of a site, cached for an hour."""
+        key = str(site_id)
+        hit, goals = self._goal_definitions.get(key)
+        if not hit:
+            goals = await self.call_api('Goals.getGoals', {'idSite': site_id})
+            # Matomo returns a dict keyed by goal ID on some versions
+            if isinstance(goals, dict):
+                goals = list(goals.values())
+            self._goal_definitions.set(key, goals)
+        return goals
+
+    async def get_goal_conversions(
+        self,
+        site_id: int,
+        period: str = 'day',
+        date: str = 'today',
+        segment: Optional[str] = None,
+        ecommerce: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Get conversion metrics of all goals joined with their definitions.
+
+        The goal definitions come from a cache; the metrics of the overall
+        conversions, every goal and optionally e-commerce orders and
+        abandoned carts are fetched in a single bulk request.
+
+        Returns:
+            One row per goal (and period, for multi-period dates)
+        """
+        goals = await self.get_goals(site_id)
+
+        targets: List[Dict[str, Any]] = [{'idgoal': None, 'name': 'All goals'}]
+        targets += [
+            {
+                'idgoal': goal.get('idgoal'),
+                'name': goal.get('name'),
+                'match_attribute': goal.get('match_attribute'),
+                'pattern': goal.get('pattern'),
+            }
+            for goal in goals
+        ]
+        if ecommerce:
+            targets += [
+                {'idgoal': 'ecommerceOrder', 'name': 'E-commerce orders'},
+                {'idgoal': 'ecommerceAbandonedCart', 'name': 'Abandoned carts'},
+            ]
+
+        results = await self.bulk_request([
+            ('Goals.get', {
+                'idSite': site_id,
+                'period': period,
+                'date': date,
+                'segment': segment,
+                'idGoal': target['idgoal'],
+            })
+            for target in targets
+        ])
+
+        rows = []
+        for target, result in zip(targets, results, strict=True):
+            for row_date, metrics in _periods(result):
+                row = {'date': row_date} if row_date is not None else {}
+                row.update(target)
+                row.update({k: metrics[k] for k in GOAL_METRICS if k in metrics})
+                rows.append(row)
+        return rows
+
+    async def get_ecommerce_items(
+        self,
+        site_id: int,
+        period: str = 'day',
+        date: str = 'today',
+        dimension: str = 'sku',
         limit: int = 10
     ) -> Any:
-        """Get referrer information."""
-        return await self.call_api('Referrers.getAll', {
+        """Get e-commerce item statistics by SKU, name or category."""
+        if dimension not in ECOMMERCE_ITEM_METHODS:
+            raise ValueError(f"Unknown item dimension: {dimension}")
+        return await self.call_api(ECOMMERCE_ITEM_METHODS[dimension], {
             'idSite': site_id,
             'period': period,
             'date': date,
             'filter_limit': limit
         })
+
+    async def get_report_level(
+        self,
+        method: str,
+        site_id: int,
+        period: str = 'day',
+        date: str = 'today',
+        limit: int = 10
+    ) -> Any:
+        """
+        Get the top level of a hierarchical report without expanding it.
+
+        Rows with children carry an ``idsubdatatable`` handle that can be
+        passed to :meth:`get_subtables`.
+        """
+        return await self.call_api(method, {
+            'idSite': site_id,
+            'period': period,
+            'date': date,
+            'filter_limit': limit,
+            'expanded': 0,
+            'flat': 0
+        })
+
+    async def get_subtables(
+        self,
+        method: str,
+        site_id: int,
+        subtable_ids: List[int],
+        period: str = 'day',
+        date: str = 'today',
+        limit: int = 10
+    ) -> Dict[str, Any]:
+        """
+        Get specific subtables of a hierarchical report.
+
+        Each subtable is cached on its own; the ones not in the cache are
+        fetched together in a single bulk request.
+
+        Args:
+            method: Report method of the parent table (e.g. 'Actions.getPageUrls')
+            site_id: The ID of the Matomo site
+            subtable_ids: ``idsubdatatable`` values of the rows to expand
+            period: Time period of the parent table
+            date: Date of the parent table
+            limit: Maximum number of rows per subtable
+
+        Returns:
+            The rows of each subtable keyed by subtable ID
+        """
+        sub_method = SUBTABLE_METHODS.get(method, method)
+        requests = {
+            str(idsubtable): {
+                'idSite': site_id,
+                'period': period,
+                'date': date,
+                'idSubtable': idsubtable,
+                'filter_limit': limit,
+            }
+            for idsubtable in dict.fromkeys(subtable_ids)
+        }
+
+        subtables: Dict[str, Any] = {}
+        missing = []
+        for idsubtable, params in requests.items():
+            key = make_cache_key(sub_method, {'method': sub_method, **params})
+            hit, rows = self.cache.get(key) if self.cache is not None else (False, None)
+            if hit:
+                subtables[idsubtable] = rows
+            else:
+                missing.append((idsubtable, key))
+
+        if missing:
+            results = await self.bulk_request(
+                [(sub_method, requests[idsubtable]) for idsubtable, _ in missing],
+                use_cache=False
+            )
+            for (idsubtable, key), rows in zip(missing, results, strict=True):
+                subtables[idsubtable] = rows
+                if self.cache is not None:
+                    self.cache.set(key, rows)
+
+        return {idsubtable: subtables[idsubtable] for idsubtable in requests}
+
+    async def compare_periods(
+        self,
+        site_id: int,
+        method: str = 'VisitsSummary.get',
+        period: str = 'day',
+        date: str = 'yesterday',
+        segment: Optional[str] = None,
+        metrics: Optional[List[str]] = None,
+        join_rows: bool = False,
+        limit: int = 10
+    ) -> Dict[str, Any]:
+        """
+        Compare a report with the same report for the preceding window.
+
+        The previous window is computed locally from ``period`` and ``date``
+        in the site timezone, and both windows are fetched concurrently.
+
+        Args:
+            site_id: The ID of the Matomo site
+            method: Report method (e.g. 'VisitsSummary.get', 'UserCountry.getCountry')
+            period: Time period of the current window
+            date: Date or date range of the current window
+            segment: Optional segment definition
+            metrics: Metrics to compare, all numeric metrics by default
+            join_rows: Also compare flat reports row by row on the label
+            limit: Maximum number of joined rows
+
+        Returns:
+            Both windows and the change of every metric
+        """
+        site = await self.get_site_info(site_id)
+        today = site_today(site.get('timezone') if isinstance(site, dict) else None)
+        current, previous = comparison_windows(period, date, today)
+
+        def params(window: Tuple[str, str]) -> Dict[str, Any]:
+            return {'idSite': site_id, 'period': window[0], 'date': window[1], 'segment': segment}
+
+        module, _, action = method.partition('.')
+        if action == 'get':
+            # Single-row reports such as VisitsSummary.get
+            current_result, previous_result = await asyncio.gather(
+                self.call_api(method, params(current)),
+                self.call_api(method, params(previous))
+            )
+            comparison = compare_reports(current_result, previous_result, metrics)
+        else:
+            comparison = await self._compare_flat(
+                module, action, params(current), params(previous), metrics, join_rows, limit
+            )
+
+        return {
+            'method': method,
+            'current': {'period': current[0], 'date': current[1]},
+            'previous': {'period': previous[0], 'date': previous[1]},
+            **comparison,
+        }
+
+
+    async def _compare_flat(
+        self,
+        module: str,
+        action: str,
+        current: Dict[str, Any],
+        previous: Dict[str, Any],
+        metrics: Optional[List[str]],
+        join_rows: bool,
+        limit: int
+    ) -> Dict[str, Any]:
+        """
+        Compare a flat report on the totals Matomo computes over all its rows.
+
+        Rows are only downloaded to join them: the top ``limit`` rows of the
+        current window, and the rows with the same labels of the previous one.
+        """
+        def processed(params: Dict[str, Any], rows: int) -> Awaitable[Any]:
+            return self.call_api('API.getProcessedReport', {
+                **params,
+                'apiModule': module,
+                'apiAction': action,
+                'filter_limit': rows,
+                'totals': 1,
+                'format_metrics': 0,
+            })
+
+        current_report, previous_report = await asyncio.gather(
+            processed(current, limit if join_rows else 1),
+            processed(previous, 1)
+        )
+        current_report = current_report if isinstance(current_report, dict) else {}
+        previous_report = previous_report if isinstance(previous_report, dict) else {}
+
+        current_rows = previous_rows = None
+        if join_rows:
+            current_rows = extract_rows(current_report.get('reportData')) or []
+            labels = [row['label'] for row in current_rows if 'label' in row]
+            previous_rows = []
+            if labels:
+                previous_rows = extract_rows(await self.call_api(
+                    f'{module}.{action}', {**previous, 'label[]': labels, 'filter_limit': -1}
+                )) or []
+
+        return compare_totals(
+            current_report.get('reportTotal') or {},
+            previous_report.get('reportTotal') or {},
+            metrics,
+            current_rows,
+            previous_rows,
+            limit
+        )
+
+
+def _periods(result: Any) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    """Split a Goals.get response into ``(date, metrics)`` pairs."""
+    if isinstance(result, list):
+        # Empty reports come back as an empty list
+        return [(None, result[0])] if result and isinstance(result[0], dict) else [(None, {})]
+    if isinstance(result, dict) and result and all(
+        isinstance(v, (dict, list)) for v in result.values()
+    ):
+        return [
+            (key, value if isinstance(value, dict) else (value[0] if value else {}))
+            for key, value in result.items()
+        ]
+    return [(None, result or {})]
@@ -0,0 +1,259 @@
+import calendar
+import re
+from datetime import date as Date
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .models import is_additive, to_number
+from .output import compute_totals, extract_rows, pick_sort_metric, sort_rows
+
+Window = Tuple[str, str]
+
+# Numeric columns that identify rows rather than measure them
+ID_COLUMNS = {'idsubdatatable', 'idsite', 'idgoal', 'idvisit', 'key'}
+
+_LAST_N = re.compile(r'^(last|previous)(\d+)$')
+_UTC_OFFSET = re.compile(r'^UTC([+-]\d+(?:\.\d+)?)?$')
+
+
+def site_today(site_timezone: Optional[str], now: Optional[datetime] = None) -> Date:
+    """
+    Return the current date in a Matomo site timezone.
+
+    Matomo timezones are either IANA names ('Europe/Berlin') or fixed
+    offsets ('UTC', 'UTC+5.5'). Unknown names fall back to UTC.
+    """
+    now = now or datetime.now(timezone.utc)
+    tz: Any = timezone.utc
+    name = site_timezone or 'UTC'
+    match = _UTC_OFFSET.match(name)
+    if match:
+        if match.group(1):
+            tz = timezone(timedelta(hours=float(match.group(1))))
+    else:
+        try:
+            from zoneinfo import ZoneInfo
+            tz = ZoneInfo(name)
+        except Exception:
+            pass
+    return now.astimezone(tz).date()
+
+
+def add_months(day: Date, months: int) -> Date:
+    """Shift a date by whole months, clamping to the end of the month."""
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    last_day = calendar.monthrange(year, month + 1)[1]
+    return Date(year, month + 1, min(day.day, last_day))
+
+
+def shift(day: Date, unit: str, count: int) -> Date:
+    """Shift a date by ``count`` periods of ``unit`` (negative for the past)."""
+    if unit == 'day':
+        return day + timedelta(days=count)
+    if unit == 'week':
+        return day + timedelta(weeks=count)
+    if unit == 'month':
+        return add_months(day, count)
+    if unit == 'year':
+        return add_months(day, 12 * count)
+    raise ValueError(f"Unknown period: {unit}")
+
+
+def parse_date(value: str, today: Date) -> Date:
+    """
+    Parse a single Matomo date.
+
+    Raises:
+        ValueError: If the date is not 'today', 'yesterday', 'now' or YYYY-MM-DD
+    """
+    value = value.strip()
+    if value in ('today', 'now'):
+        return today
+    if value == 'yesterday':
+        return today - timedelta(days=1)
+    try:
+        return Date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Unsupported date for comparison: {value}") from None
+
+
+def _period_start(day: Date, unit: str) -> Date:
+    if unit == 'week':
+        return day - timedelta(days=day.weekday())
+    if unit == 'month':
+        return day.replace(day=1)
+    if unit == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def _range(start: Date, end: Date) -> Window:
+    return 'range', f"{start.isoformat()},{end.isoformat()}"
+
+
+def comparison_windows(period: str, date: str, today: Date) -> Tuple[Window, Window]:
+    """
+    Compute the current window and the window immediately before it.
+
+    Single dates keep their period, so both windows can be served from
+    Matomo's regular archives: the previous window is one period earlier.
+    Ranges and ``lastN`` dates, whose last period runs up to today, are
+    compared with a range of the same number of days ending the day before
+    they start. ``previousN`` dates cover complete periods and are compared
+    with the ``N`` complete periods before them. Either way the previous
+    window ends the day before the current one starts.
+
+    Args:
+        period: Matomo period (day, week, month, year or range)
+        date: Matomo date expression
+        today: Current date in the site timezone
+
+    Returns:
+        ``((period, date), (period, date))`` for the current and previous window
+
+    Raises:
+        ValueError: If the period or date cannot be compared
+    """
+    if period not in ('day', 'week', 'month', 'year', 'range'):
+        raise ValueError(f"Unknown period: {period}")
+
+    if ',' in date:
+        start, end = (parse_date(part, today) for part in date.split(',', 1))
+        if end < start:
+            raise ValueError(f"Invalid date range: {date}")
+        length = (end - start).days
+        previous_end = start - timedelta(days=1)
+        return _range(start, end), _range(previous_end - timedelta(days=length), previous_end)
+
+    match = _LAST_N.match(date)
+    if match:
+        unit = 'day' if period == 'range' else period
+        count = int(match.group(2))
+        if count < 1:
+            raise ValueError(f"Invalid date: {date}")
+        end = today if match.group(1) == 'last' else _period_start(today, unit) - timedelta(days=1)
+        start = shift(_period_start(end, unit), unit, -(count - 1))
+        previous_end = start - timedelta(days=1)
+        if match.group(1) == 'last':
+            # The current period is incomplete, so compare the same number of days
+            previous_start = previous_end - (end - start)
+        else:
+            previous_start = shift(start, unit, -count)
+        return _range(start, end), _range(previous_start, previous_end)
+
+    if period == 'range':
+        raise ValueError("A range period needs a date range such as '2024-01-01,2024-01-31'")
+
+    day = parse_date(date, today)
+    return (period, day.isoformat()), (period, shift(day, period, -1).isoformat())
+
+
+def window_bounds(window: Window) -> Tuple[Date, Date]:
+    """Return the first and last day of a ``(period, date)`` window."""
+    period, value = window
+    if period == 'range':
+        start, end = (Date.fromisoformat(part) for part in value.split(',', 1))
+        return start, end
+    start = _period_start(Date.fromisoformat(value), period)
+    return start, shift(start, period, 1) - timedelta(days=1)
+
+
+def diff_values(current: Any, previous: Any) -> Dict[str, Any]:
+    """Describe the change between two metric values."""
+    cur, prev = to_number(current), to_number(previous)
+    change = round(cur - prev, 2) if cur is not None and prev is not None else None
+    percent = None
+    if change is not None and prev:
+        percent = round(100 * change / abs(prev), 1)
+    return {'current': cur, 'previous': prev, 'change': change, 'change_percent': percent}
+
+
+def diff_metrics(
+    current: Dict[str, Any],
+    previous: Dict[str, Any],
+    metrics: Optional[List[str]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """Diff the numeric metrics of two rows."""
+    if metrics is None:
+        metrics = [
+            k for k in dict.fromkeys([*current, *previous])
+            if k not in ID_COLUMNS and to_number(current.get(k, previous.get(k))) is not None
+        ]
+    return {m: diff_values(current.get(m), previous.get(m)) for m in metrics}
+
+
+def compare_reports(
+    current: Any,
+    previous: Any,
+    metrics: Optional[List[str]] = None,
+    join_rows: bool = False,
+    limit: int = 10
+) -> Dict[str, Any]:
+    """
+    Compare two responses of the same report.
+
+    Single-row reports are diffed metric by metric. Flat reports are
+    compared on the totals of their additive metrics and, with
+    ``join_rows``, additionally row by row on the label.
+    """
+    current_rows = extract_rows(current) if isinstance(current, list) else None
+    previous_rows = extract_rows(previous) if isinstance(previous, list) else None
+
+    if current_rows is None or previous_rows is None:
+        return {'metrics': diff_metrics(current or {}, previous or {}, metrics)}
+
+    comparison: Dict[str, Any] = {
+        'rows': {'current': len(current_rows), 'previous': len(previous_rows)},
+        'metrics': diff_metrics(
+            compute_totals(current_rows), compute_totals(previous_rows), metrics
+        ),
+    }
+    if join_rows:
+        comparison['joined_rows'] = join_labels(current_rows, previous_rows, metrics, limit)
+    return comparison
+
+
+def compare_totals(
+    current_totals: Dict[str, Any],
+    previous_totals: Dict[str, Any],
+    metrics: Optional[List[str]] = None,
+    current_rows: Optional[List[Dict[str, Any]]] = None,
+    previous_rows: Optional[List[Dict[str, Any]]] = None,
+    limit: int = 10
+) -> Dict[str, Any]:
+    """
+    Compare two flat reports on totals computed by Matomo.
+
+    Only additive metrics are compared, since Matomo's report totals also
+    contain sums of ratios. With ``current_rows``, the top rows are joined
+    on the label with ``previous_rows``.
+    """
+    comparison: Dict[str, Any] = {
+        'metrics': diff_metrics(
+            {k: v for k, v in (current_totals or {}).items() if is_additive(k)},
+            {k: v for k, v in (previous_totals or {}).items() if is_additive(k)},
+            metrics
+        ),
+    }
+    if current_rows is not None:
+        comparison['joined_rows'] = join_labels(current_rows, previous_rows or [], metrics, limit)
+    return comparison
+
+
+def join_labels(
+    current_rows: List[Dict[str, Any]],
+    previous_rows: List[Dict[str, Any]],
+    metrics: Optional[List[str]] = None,
+    limit: int = 10
+) -> List[Dict[str, Any]]:
+    """Diff the top ``limit`` current rows with the previous rows of the same label."""
+    by_label = {row.get('label'): row for row in previous_rows}
+    ordered = sort_rows(current_rows, pick_sort_metric(current_rows))
+    return [
+        {
+            'label': row.get('label'),
+            'metrics': diff_metrics(row, by_label.get(row.get('label'), {}), metrics),
+        }
+        for row in ordered[:limit]
+    ]
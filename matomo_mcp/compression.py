@@ -0,0 +1,97 @@
+import importlib.util
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Preferred order: zstd and brotli compress large JSON reports best, and
+# httpx decodes them when one of the listed packages is installed
+_PREFERENCE = [
+    ('zstd', ('zstandard',)),
+    ('br', ('brotli', 'brotlicffi')),
+    ('gzip', ()),
+    ('deflate', ()),
+]
+
+
+def supported_encodings() -> List[str]:
+    """
+    Return the content encodings httpx can decode in this environment.
+
+    ``br`` and ``zstd`` are only available when the optional ``brotli`` and
+    ``zstandard`` packages are installed (``pip install matomo-mcp[compression]``).
+    """
+    return [
+        encoding for encoding, packages in _PREFERENCE
+        if not packages or any(importlib.util.find_spec(name) for name in packages)
+    ]
+
+
+ACCEPT_ENCODING = ', '.join(supported_encodings())
+
+
+def cache_validators(headers: httpx.Headers) -> Optional[Dict[str, str]]:
+    """Extract ETag/Last-Modified validators from response headers."""
+    validators = {}
+    if headers.get('etag'):
+        validators['etag'] = headers['etag']
+    if headers.get('last-modified'):
+        validators['last_modified'] = headers['last-modified']
+    return validators or None
+
+
+def conditional_headers(validators: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """Build If-None-Match/If-Modified-Since headers from stored validators."""
+    headers = {}
+    if validators:
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+class TransferStats:
+    """Account for bytes on the wire versus decoded bytes per content encoding."""
+
+    def __init__(self):
+        self.responses = 0
+        self.not_modified = 0
+        # Requests cancelled before their response arrived
+        self.aborted = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.by_encoding: Dict[str, Dict[str, int]] = {}
+
+    def record(self, response: httpx.Response) -> None:
+        """Record a received response."""
+        encoding = response.headers.get('content-encoding', 'identity').lower()
+        decoded = len(response.content)
+        # Responses built in memory report no downloaded bytes
+        wire = response.num_bytes_downloaded or decoded
+
+        self.responses += 1
+        if response.status_code == 304:
+            self.not_modified += 1
+        self.wire_bytes += wire
+        self.decoded_bytes += decoded
+
+        entry = self.by_encoding.setdefault(
+            encoding, {'responses': 0, 'wire_bytes': 0, 'decoded_bytes': 0}
+        )
+        entry['responses'] += 1
+        entry['wire_bytes'] += wire
+        entry['decoded_bytes'] += decoded
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'accept_encoding': ACCEPT_ENCODING,
+            'responses': self.responses,
+            'not_modified': self.not_modified,
+            'aborted': self.aborted,
+            'wire_bytes': self.wire_bytes,
+            'decoded_bytes': self.decoded_bytes,
+            'compression_ratio': (
+                round(self.decoded_bytes / self.wire_bytes, 2) if self.wire_bytes else None
+            ),
+            'by_encoding': {k: dict(v) for k, v in self.by_encoding.items()},
+        }
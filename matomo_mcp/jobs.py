@@ -0,0 +1,276 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .memory import MemoryBudget
+
+
+def make_request_key(name: str, arguments: Optional[Dict[str, Any]]) -> str:
+    """Build a stable key identifying a request by its name and arguments."""
+    return name + ":" + json.dumps(arguments or {}, sort_keys=True, default=str)
+
+
+class Job:
+    """A Matomo request running in the background."""
+
+    def __init__(self, job_id: str, key: str, name: str, task: asyncio.Task):
+        self.job_id = job_id
+        self.key = key
+        self.name = name
+        self.task = task
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.detached = False
+        # Callers currently waiting for the result in the foreground
+        self.waiters = 0
+        # Memory of the kept result charged to the budget
+        self.size = 0
+
+    @property
+    def status(self) -> str:
+        """Return 'running', 'done', 'error' or 'cancelled'."""
+        if not self.task.done():
+            return "running"
+        if self.task.cancelled():
+            return "cancelled"
+        if self.task.exception() is not None:
+            return "error"
+        return "done"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Describe the job without its result."""
+        end = self.finished_at if self.finished_at is not None else time.time()
+        info = {
+            "job_id": self.job_id,
+            "name": self.name,
+            "status": self.status,
+            "elapsed_seconds": round(end - self.created_at, 3),
+        }
+        if info["status"] == "error":
+            info["error"] = str(self.task.exception())
+        return info
+
+
+class JobManager:
+    """
+    Run requests with a foreground time limit, turning slow ones into jobs.
+
+    A request that finishes within ``threshold`` seconds is returned directly.
+    Otherwise it keeps running as a background job whose handle is returned,
+    and the result can be fetched later by job ID. Requests sharing a key
+    attach to the same job while it is running; a request made after it
+    finished starts afresh, so results are never served stale from here.
+    Finished jobs are kept for ``retention`` seconds, up to ``max_jobs`` in
+    total, but only for retrieval by job ID.
+
+    A caller that is cancelled while waiting detaches from the job. When no
+    caller is left waiting and no job handle was handed out, nobody can
+    receive the result anymore, so the work is cancelled, which aborts its
+    in-flight HTTP requests.
+
+    Results kept for retrieval are charged to ``budget``, and :meth:`shrink`
+    drops the oldest finished jobs when the budget needs memory back.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 20.0,
+        retention: float = 600.0,
+        max_jobs: int = 100,
+        budget: Optional[MemoryBudget] = None
+    ):
+        """
+        Initialize the job manager.
+
+        Args:
+            threshold: Seconds to wait before handing back a job handle
+            retention: Seconds a finished job is kept for retrieval
+            max_jobs: Maximum number of jobs kept at any time
+            budget: Memory budget charged for the results of finished jobs
+        """
+        self.threshold = threshold
+        self.retention = retention
+        self.max_jobs = max_jobs
+        self.budget = budget
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[str, Job] = {}
+        self._ids = itertools.count(1)
+        # Work thrown away because of cancellations and deadlines
+        self.abandoned_waiters = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.wasted_seconds = 0.0
+
+    async def run(
+        self,
+        key: str,
+        name: str,
+        factory: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Tuple[Optional[Job], Any]:
+        """
+        Run a request, or attach to a running job with the same key.
+
+        Args:
+            key: Request key used for deduplication; requests with different
+                timeouts should have different keys
+            name: Human readable name of the request (e.g. the tool name)
+            factory: Callable returning the awaitable doing the actual work
+            timeout: Deadline in seconds after which a new job is cancelled
+                and fails with TimeoutError, also when running in the background
+
+        Returns:
+            ``(None, result)`` if the request completed within the threshold,
+            otherwise ``(job, None)`` for the still running job
+
+        Raises:
+            Exception: Whatever the request raised, if it failed in time
+        """
+        self._prune()
+
+        job = self._by_key.get(key)
+        if job is None or job.task.done():
+            job = self._start(key, name, factory, timeout)
+
+        job.waiters += 1
+        try:
+            done, _ = await asyncio.wait({job.task}, timeout=self.threshold)
+        except asyncio.CancelledError:
+            job.waiters -= 1
+            self._abandon(job)
+            raise
+        job.waiters -= 1
+
+        if not done:
+            job.detached = True
+            return job, None
+
+        # Requests answered in the foreground are not kept as jobs
+        if not job.detached:
+            self._drop(job)
+        return None, job.task.result()
+
+    def get(self, job_id: str) -> Job:
+        """
+        Look up a job by ID.
+
+        Raises:
+            ValueError: If the job is unknown or has expired
+        """
+        self._prune()
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Unknown or expired job: {job_id}")
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> Job:
+        """Wait up to ``timeout`` seconds for a job to finish and return it."""
+        job = self.get(job_id)
+        if timeout > 0 and not job.task.done():
+            await asyncio.wait({job.task}, timeout=timeout)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        """Return job counts and the work wasted on cancelled requests."""
+        return {
+            "jobs": len(self._jobs),
+            "running": sum(1 for j in self._jobs.values() if j.finished_at is None),
+            "abandoned_waiters": self.abandoned_waiters,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+            "wasted_seconds": round(self.wasted_seconds, 3),
+        }
+
+    def shrink(self, nbytes: int) -> int:
+        """
+        Drop the oldest finished jobs until ``nbytes`` are freed.
+
+        Returns:
+            The number of bytes freed
+        """
+        freed = 0
+        finished = sorted(
+            (j for j in self._jobs.values() if j.size),
+            key=lambda j: j.finished_at or 0.0
+        )
+        for job in finished:
+            if freed >= nbytes:
+                break
+            freed += job.size
+            self._drop(job)
+        return freed
+
+    def _start(
+        self,
+        key: str,
+        name: str,
+        factory: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Job:
+        job_id = f"job-{next(self._ids)}"
+        work = factory() if timeout is None else _with_deadline(factory(), name, timeout)
+        task = asyncio.ensure_future(work)
+        job = Job(job_id, key, name, task)
+        task.add_done_callback(lambda _: self._finished(job))
+        self._jobs[job_id] = job
+        self._by_key[key] = job
+        self._prune()
+        return job
+
+    def _finished(self, job: Job) -> None:
+        job.finished_at = time.time()
+        # Finished jobs stay reachable by ID only
+        if self._by_key.get(job.key) is job:
+            del self._by_key[job.key]
+        # Retrieve the exception so asyncio does not log it as never retrieved
+        if not job.task.cancelled() and isinstance(job.task.exception(), TimeoutError):
+            self.timed_out += 1
+            self.wasted_seconds += job.finished_at - job.created_at
+
+        # Results answered in the foreground are not kept; detached ones are,
+        # charged for the memory they do not share with the response cache
+        if job.detached and self.budget is not None and job.status == "done":
+            job.size = self.budget.unaccounted_size(job.task.result())
+            self.budget.add("jobs", job.size)
+
+    def _abandon(self, job: Job) -> None:
+        """Handle a caller that stopped waiting for a job."""
+        self.abandoned_waiters += 1
+        if job.waiters or job.detached or job.task.done():
+            return
+        job.task.cancel()
+        self.cancelled += 1
+        self.wasted_seconds += time.time() - job.created_at
+        self._drop(job)
+
+    def _drop(self, job: Job) -> None:
+        if self._jobs.pop(job.job_id, None) is not None and job.size and self.budget is not None:
+            self.budget.remove("jobs", job.size)
+            job.size = 0
+        if self._by_key.get(job.key) is job:
+            del self._by_key[job.key]
+
+    def _prune(self) -> None:
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.finished_at is not None and now - job.finished_at > self.retention:
+                self._drop(job)
+
+        # Over capacity: evict the oldest finished jobs first
+        excess = len(self._jobs) - self.max_jobs
+        if excess > 0:
+            finished = sorted(
+                (j for j in self._jobs.values() if j.finished_at is not None),
+                key=lambda j: j.finished_at or 0.0
+            )
+            for job in finished[:excess]:
+                self._drop(job)
+
+
+async def _with_deadline(work: Awaitable[Any], name: str, timeout: float) -> Any:
+    try:
+        return await asyncio.wait_for(work, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{name} did not finish within {timeout * 1000:g} ms") from None
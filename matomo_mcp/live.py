@@ -0,0 +1,172 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .client import MatomoClient
+
+
+class CompactVisit:
+    """The parts of a Live visit needed to answer real-time questions."""
+
+    __slots__ = (
+        'idvisit', 'visitor_id', 'first_action', 'last_action', 'country',
+        'device', 'browser', 'referrer_type', 'actions', 'pageviews',
+    )
+
+    def __init__(self, visit: Dict[str, Any]):
+        self.idvisit = int(visit['idVisit'])
+        self.visitor_id = visit.get('visitorId')
+        self.first_action = int(visit.get('firstActionTimestamp') or visit.get('serverTimestamp') or 0)
+        self.last_action = int(visit.get('lastActionTimestamp') or self.first_action)
+        self.country = visit.get('country')
+        self.device = visit.get('deviceType')
+        self.browser = visit.get('browserName')
+        self.referrer_type = visit.get('referrerType')
+        self.actions = int(visit.get('actions') or 0)
+        # (timestamp, url) of every pageview, the only action detail kept
+        self.pageviews: Tuple[Tuple[int, str], ...] = tuple(
+            (int(action.get('timestamp') or self.last_action), action['url'])
+            for action in visit.get('actionDetails') or ()
+            if action.get('type') == 'action' and action.get('url')
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'idvisit': self.idvisit,
+            'visitor_id': self.visitor_id,
+            'first_action': self.first_action,
+            'last_action': self.last_action,
+            'country': self.country,
+            'device': self.device,
+            'browser': self.browser,
+            'referrer_type': self.referrer_type,
+            'actions': self.actions,
+            'last_page': self.pageviews[-1][1] if self.pageviews else None,
+        }
+
+
+class _SiteBuffer:
+    def __init__(self):
+        self.visits: "OrderedDict[int, CompactVisit]" = OrderedDict()
+        self.cursor: Optional[int] = None
+        self.last_poll = 0.0
+        self.lock = asyncio.Lock()
+
+
+class LiveTracker:
+    """
+    Incrementally follow the Live visitor log of sites.
+
+    Every poll only asks Matomo for visits with activity after the cursor
+    (the newest last action timestamp seen), updates a bounded buffer of
+    compact visits, and answers questions about the last minutes from it.
+    """
+
+    def __init__(
+        self,
+        client: MatomoClient,
+        buffer_size: int = 1000,
+        max_minutes: int = 60,
+        min_interval: float = 5.0
+    ):
+        """
+        Initialize the tracker.
+
+        Args:
+            client: Matomo client used for polling
+            buffer_size: Maximum number of visits kept per site
+            max_minutes: How far back the first poll of a site reaches
+            min_interval: Seconds between two polls of the same site
+        """
+        self.client = client
+        self.buffer_size = buffer_size
+        self.max_minutes = max_minutes
+        self.min_interval = min_interval
+        self._sites: Dict[str, _SiteBuffer] = {}
+
+    async def poll(self, site_id: int) -> int:
+        """
+        Fetch visits that are new or changed since the last poll.
+
+        Returns:
+            Number of visits received from Matomo
+        """
+        buffer = self._sites.setdefault(str(site_id), _SiteBuffer())
+        async with buffer.lock:
+            now = time.time()
+            if now - buffer.last_poll < self.min_interval:
+                return 0
+
+            min_timestamp = buffer.cursor
+            if min_timestamp is None:
+                min_timestamp = int(now) - self.max_minutes * 60
+
+            # No period/date: they would cut the window at the site's midnight
+            visits = await self.client.call_api('Live.getLastVisitsDetails', {
+                'idSite': site_id,
+                'minTimestamp': min_timestamp,
+                'filter_limit': self.buffer_size,
+            })
+            buffer.last_poll = now
+
+            # Matomo returns the newest visits first; insert oldest first so
+            # the buffer stays ordered by last activity
+            for raw in reversed(visits or []):
+                visit = CompactVisit(raw)
+                buffer.visits.pop(visit.idvisit, None)
+                buffer.visits[visit.idvisit] = visit
+                if buffer.cursor is None or visit.last_action > buffer.cursor:
+                    buffer.cursor = visit.last_action
+
+            while len(buffer.visits) > self.buffer_size:
+                buffer.visits.popitem(last=False)
+
+            return len(visits or [])
+
+    def summary(self, site_id: int, minutes: int = 30, limit: int = 10) -> Dict[str, Any]:
+        """
+        Summarize the buffered activity of the last ``minutes`` minutes.
+
+        Args:
+            site_id: The ID of the Matomo site
+            minutes: Size of the window, capped at ``max_minutes``
+            limit: Number of entries in each top list
+        """
+        minutes = min(minutes, self.max_minutes)
+        since = int(time.time()) - minutes * 60
+        buffer = self._sites.get(str(site_id)) or _SiteBuffer()
+
+        active: List[CompactVisit] = [
+            v for v in buffer.visits.values() if v.last_action >= since
+        ]
+        pages: Counter = Counter(
+            url for v in active for ts, url in v.pageviews if ts >= since
+        )
+        oldest = next(iter(buffer.visits.values()), None)
+
+        return {
+            'site_id': site_id,
+            'minutes': minutes,
+            'visits': len(active),
+            'visitors': len({v.visitor_id for v in active}),
+            'actions': sum(v.actions for v in active),
+            'pageviews': sum(pages.values()),
+            'top_pages': _top(pages, limit),
+            'countries': _top(Counter(v.country for v in active if v.country), limit),
+            'devices': _top(Counter(v.device for v in active if v.device), limit),
+            'referrer_types': _top(
+                Counter(v.referrer_type for v in active if v.referrer_type), limit
+            ),
+            'recent_visits': [v.to_dict() for v in reversed(active[-limit:])],
+            # The buffer dropped visits that would fall into the window
+            'truncated': (
+                len(buffer.visits) >= self.buffer_size
+                and oldest is not None
+                and oldest.last_action >= since
+            ),
+        }
+
+
+def _top(counter: Counter, limit: int) -> List[Dict[str, Any]]:
+    return [{'label': label, 'count': count} for label, count in counter.most_common(limit)]
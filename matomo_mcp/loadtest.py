@@ -0,0 +1,426 @@
+"""
+Load-test driver for the Matomo MCP server.
+
+Spawns the server as a subprocess speaking JSON-RPC over stdio, performs the
+MCP handshake, then lets a number of virtual sessions issue a weighted mix
+of ``tools/call`` requests concurrently over the connection, each pausing
+for a random think time between calls. Throughput, latency percentiles, the
+error rate and the server's CPU and RSS over time are reported at the end.
+
+Run against recorded traffic to avoid touching a production instance::
+
+    MATOMO_REPLAY=cassette.jsonl MATOMO_REPLAY_SPEED=1 \\
+        python -m matomo_mcp.loadtest --concurrency 50 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+# Used when no --mix file is given; {site_id} is replaced by --site-id
+DEFAULT_MIX = [
+    {"name": "get_visits_summary", "weight": 4,
+     "arguments": {"site_id": "{site_id}", "period": "day", "date": "yesterday"}},
+    {"name": "get_page_urls", "weight": 3,
+     "arguments": {"site_id": "{site_id}", "period": "day", "date": "yesterday", "limit": 10}},
+    {"name": "get_countries", "weight": 2,
+     "arguments": {"site_id": "{site_id}", "period": "week", "date": "yesterday"}},
+    {"name": "get_referrers", "weight": 1,
+     "arguments": {"site_id": "{site_id}", "period": "month", "date": "yesterday"}},
+]
+
+_MAX_LINE = 64 * 1024 * 1024
+
+
+def load_mix(path: Optional[str], site_id: int) -> List[Dict[str, Any]]:
+    """
+    Load a request mix and fill in the site ID.
+
+    The mix is a JSON list of ``{"name", "arguments", "weight"}`` objects.
+
+    Raises:
+        ValueError: If the mix is empty or an entry has no tool name
+    """
+    if path:
+        with open(path, encoding='utf-8') as f:
+            mix = json.load(f)
+    else:
+        mix = DEFAULT_MIX
+
+    entries = []
+    for entry in mix:
+        if not entry.get("name"):
+            raise ValueError(f"Mix entry without tool name: {entry}")
+        arguments = {
+            k: site_id if v == "{site_id}" else v
+            for k, v in (entry.get("arguments") or {}).items()
+        }
+        entries.append({
+            "name": entry["name"],
+            "arguments": arguments,
+            "weight": float(entry.get("weight", 1)),
+        })
+    if not entries:
+        raise ValueError("The request mix is empty")
+    return entries
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Return the ``pct`` percentile of ``values`` (nearest rank)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class ProcessSampler:
+    """Sample CPU usage and resident memory of a process."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self._last: Optional[tuple] = None
+        try:
+            import psutil
+            self._process = psutil.Process(pid)
+        except Exception:
+            self._process = None
+
+    def _cpu_seconds(self) -> Optional[float]:
+        if self._process is not None:
+            times = self._process.cpu_times()
+            return float(times.user + times.system)
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self._ticks
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def _rss_bytes(self) -> Optional[int]:
+        if self._process is not None:
+            return int(self._process.memory_info().rss)
+        try:
+            with open(f'/proc/{self.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def sample(self) -> Dict[str, Optional[float]]:
+        """Return CPU percent since the previous sample and current RSS."""
+        now = time.monotonic()
+        cpu = self._cpu_seconds()
+        cpu_percent = None
+        if cpu is not None and self._last is not None and now > self._last[0]:
+            cpu_percent = round(100 * (cpu - self._last[1]) / (now - self._last[0]), 1)
+        if cpu is not None:
+            self._last = (now, cpu)
+        rss = self._rss_bytes()
+        return {
+            "cpu_percent": cpu_percent,
+            "rss_mb": round(rss / 1024 / 1024, 1) if rss is not None else None,
+        }
+
+
+class StdioSession:
+    """Minimal JSON-RPC client multiplexing requests over the server's stdio."""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        if process.stdin is None or process.stdout is None:
+            raise ValueError("The server must be started with stdin and stdout pipes")
+        self.process = process
+        self._stdin = process.stdin
+        self._stdout = process.stdout
+        self._ids = 0
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self) -> None:
+        while True:
+            line = await self._stdout.readline()
+            if not line:
+                break
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            future = self._pending.pop(message.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(message)
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Server closed the connection"))
+
+    async def _send(self, message: Dict[str, Any]) -> None:
+        self._stdin.write(json.dumps(message).encode() + b"\n")
+        await self._stdin.drain()
+
+    async def request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a request and wait for its response."""
+        self._ids += 1
+        request_id = self._ids
+        future: asyncio.Future[Dict[str, Any]] = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        await self._send({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+        return await future
+
+    async def notify(self, method: str, params: Optional[Dict[str, Any]] = None) -> None:
+        """Send a notification."""
+        message: Dict[str, Any] = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        await self._send(message)
+
+    async def initialize(self) -> Dict[str, Any]:
+        """Perform the MCP handshake."""
+        result = await self.request("initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "matomo-mcp-loadtest", "version": "1.0"},
+        })
+        await self.notify("notifications/initialized")
+        return result
+
+    async def close(self) -> None:
+        self._reader.cancel()
+        if self.process.stdin and not self.process.stdin.is_closing():
+            self.process.stdin.close()
+
+
+def is_error(message: Dict[str, Any]) -> bool:
+    """Whether a tools/call response reports a failure."""
+    if "error" in message:
+        return True
+    result = message.get("result") or {}
+    if result.get("isError"):
+        return True
+    content = result.get("content") or []
+    return bool(content) and str(content[0].get("text", "")).startswith("Error:")
+
+
+class LoadTest:
+    """Drive concurrent tool calls against one server process."""
+
+    def __init__(
+        self,
+        command: List[str],
+        mix: List[Dict[str, Any]],
+        concurrency: int = 10,
+        duration: float = 30.0,
+        think_time: float = 0.0,
+        sample_interval: float = 1.0,
+        seed: Optional[int] = None
+    ):
+        """
+        Initialize the load test.
+
+        Args:
+            command: Command starting the server
+            mix: Weighted tool calls, see :func:`load_mix`
+            concurrency: Number of concurrent sessions issuing calls
+            duration: Seconds to generate load
+            think_time: Mean pause in seconds between calls of one session
+                (exponentially distributed), 0 for none
+            sample_interval: Seconds between CPU/RSS samples
+            seed: Seed for the random mix and think times
+        """
+        self.command = command
+        self.mix = mix
+        self.concurrency = concurrency
+        self.duration = duration
+        self.think_time = think_time
+        self.sample_interval = sample_interval
+        self.random = random.Random(seed)
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.per_tool: Dict[str, Dict[str, Any]] = {}
+        self.timeline: List[Dict[str, Any]] = []
+
+    async def _session(self, session: StdioSession, deadline: float) -> None:
+        weights = [entry["weight"] for entry in self.mix]
+        while time.monotonic() < deadline:
+            entry = self.random.choices(self.mix, weights=weights)[0]
+            started = time.monotonic()
+            try:
+                message = await session.request("tools/call", {
+                    "name": entry["name"],
+                    "arguments": entry["arguments"],
+                })
+                failed = is_error(message)
+            except ConnectionError:
+                self.errors += 1
+                return
+            latency = time.monotonic() - started
+
+            self.latencies.append(latency)
+            stats = self.per_tool.setdefault(entry["name"], {"latencies": [], "errors": 0})
+            stats["latencies"].append(latency)
+            if failed:
+                self.errors += 1
+                stats["errors"] += 1
+
+            if self.think_time > 0:
+                await asyncio.sleep(self.random.expovariate(1 / self.think_time))
+
+    async def _sample(self, sampler: ProcessSampler, started: float) -> None:
+        sampler.sample()
+        completed = 0
+        while True:
+            await asyncio.sleep(self.sample_interval)
+            done = len(self.latencies)
+            self.timeline.append({
+                "t": round(time.monotonic() - started, 1),
+                "throughput": round((done - completed) / self.sample_interval, 1),
+                "errors": self.errors,
+                **sampler.sample(),
+            })
+            completed = done
+
+    async def run(self) -> Dict[str, Any]:
+        """Start the server, generate load and return the report."""
+        process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            limit=_MAX_LINE,
+        )
+        session = StdioSession(process)
+        try:
+            await asyncio.wait_for(session.initialize(), timeout=30)
+
+            started = time.monotonic()
+            deadline = started + self.duration
+            sampler = asyncio.ensure_future(self._sample(ProcessSampler(process.pid), started))
+            await asyncio.gather(*(
+                self._session(session, deadline) for _ in range(self.concurrency)
+            ))
+            elapsed = time.monotonic() - started
+            sampler.cancel()
+        finally:
+            await session.close()
+            try:
+                await asyncio.wait_for(process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """Summarize the collected measurements."""
+        def latency_stats(values: List[float]) -> Dict[str, Optional[float]]:
+            return {
+                name: round(value * 1000, 1) if value is not None else None
+                for name, value in (
+                    ("p50_ms", percentile(values, 50)),
+                    ("p90_ms", percentile(values, 90)),
+                    ("p99_ms", percentile(values, 99)),
+                    ("max_ms", max(values) if values else None),
+                )
+            }
+
+        total = len(self.latencies)
+        samples = [s for s in self.timeline if s["rss_mb"] is not None]
+        return {
+            "concurrency": self.concurrency,
+            "duration_seconds": round(elapsed, 2),
+            "requests": total,
+            "errors": self.errors,
+            "error_rate": round(self.errors / total, 4) if total else None,
+            "throughput_rps": round(total / elapsed, 1) if elapsed else None,
+            "latency": latency_stats(self.latencies),
+            "per_tool": {
+                name: {
+                    "requests": len(stats["latencies"]),
+                    "errors": stats["errors"],
+                    **latency_stats(stats["latencies"]),
+                }
+                for name, stats in sorted(self.per_tool.items())
+            },
+            "peak_rss_mb": max((s["rss_mb"] for s in samples), default=None),
+            "timeline": self.timeline,
+        }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Render a report as human readable text."""
+    latency = report["latency"]
+    lines = [
+        f"Requests:    {report['requests']} in {report['duration_seconds']}s "
+        f"({report['throughput_rps']} req/s, concurrency {report['concurrency']})",
+        f"Errors:      {report['errors']} (rate {report['error_rate']})",
+        f"Latency:     p50 {latency['p50_ms']} ms, p90 {latency['p90_ms']} ms, "
+        f"p99 {latency['p99_ms']} ms, max {latency['max_ms']} ms",
+        f"Peak RSS:    {report['peak_rss_mb']} MB",
+        "",
+        "Per tool:",
+    ]
+    for name, stats in report["per_tool"].items():
+        lines.append(
+            f"  {name:<24} {stats['requests']:>7} req  {stats['errors']:>5} err  "
+            f"p50 {stats['p50_ms']} ms  p99 {stats['p99_ms']} ms"
+        )
+    lines += ["", "    t   req/s  errors   cpu%   rss MB"]
+    for s in report["timeline"]:
+        lines.append(
+            f"{s['t']:>5} {s['throughput']:>7} {s['errors']:>7} "
+            f"{s['cpu_percent'] if s['cpu_percent'] is not None else '-':>6} "
+            f"{s['rss_mb'] if s['rss_mb'] is not None else '-':>8}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        prog="python -m matomo_mcp.loadtest",
+        description="Generate concurrent tools/call load against the Matomo MCP server over stdio."
+    )
+    parser.add_argument("--concurrency", type=int, default=10,
+                        help="concurrent sessions issuing tool calls (default: 10)")
+    parser.add_argument("--duration", type=float, default=30.0,
+                        help="seconds to generate load (default: 30)")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="mean seconds between calls of one session (default: 0)")
+    parser.add_argument("--mix", help="JSON file with weighted tool calls")
+    parser.add_argument("--site-id", type=int, default=1,
+                        help="site ID used by the default mix (default: 1)")
+    parser.add_argument("--sample-interval", type=float, default=1.0,
+                        help="seconds between CPU/RSS samples (default: 1)")
+    parser.add_argument("--seed", type=int, help="random seed for reproducible runs")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    parser.add_argument("--server-command", nargs=argparse.REMAINDER,
+                        help="command starting the server (default: this Python with -m matomo_mcp)")
+    args = parser.parse_args(argv)
+
+    test = LoadTest(
+        command=args.server_command or [sys.executable, "-m", "matomo_mcp"],
+        mix=load_mix(args.mix, args.site_id),
+        concurrency=args.concurrency,
+        duration=args.duration,
+        think_time=args.think_time,
+        sample_interval=args.sample_interval,
+        seed=args.seed,
+    )
+    report = asyncio.run(test.run())
+
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["requests"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
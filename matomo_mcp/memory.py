@@ -0,0 +1,241 @@
+import asyncio
+import contextvars
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+# What memory is accounted for
+CATEGORIES = ('responses', 'decoded', 'cache', 'jobs')
+
+
+class MemoryLimitExceeded(Exception):
+    """Raised when a call, a response or the server exceeds its memory budget."""
+
+
+def estimate_size(value: Any, exclude: Optional[Set[int]] = None) -> int:
+    """
+    Approximate the memory held by a decoded JSON value in bytes.
+
+    Objects referenced several times (interned strings, small integers,
+    shared columns) are counted once. Objects with ``__slots__``, such as
+    the report models, are followed through their slots.
+
+    Args:
+        value: The value to measure
+        exclude: IDs of objects accounted for elsewhere, skipped with
+            everything only reachable through them
+    """
+    seen = set(exclude or ())
+    stack = [value]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        else:
+            for cls in type(obj).__mro__:
+                for slot in getattr(cls, '__slots__', ()):
+                    if hasattr(obj, slot):
+                        stack.append(getattr(obj, slot))
+    return total
+
+
+class CallUsage:
+    """Memory charged to one tool call."""
+
+    __slots__ = ('by_category', 'closed')
+
+    def __init__(self):
+        self.by_category = dict.fromkeys(CATEGORIES, 0)
+        # Set when the call ended and its memory was released
+        self.closed = False
+
+    @property
+    def total(self) -> int:
+        return sum(self.by_category.values())
+
+
+_current_call: contextvars.ContextVar[Optional[CallUsage]] = contextvars.ContextVar(
+    'matomo_mcp_call_usage', default=None
+)
+
+
+class MemoryBudget:
+    """
+    Account for the memory held by the server and keep it within a budget.
+
+    Response bodies and decoded results are charged to the tool call
+    running them (see :meth:`track`) until the call finishes; cached
+    responses and finished job results are charged by the cache and the
+    job manager. When the total exceeds ``limit``, registered reclaimers
+    are asked to free memory in the order they were added,
+    new calls wait in :meth:`admit` until memory is released, and a single
+    call needing more than ``call_limit`` fails.
+    """
+
+    def __init__(self, limit: int = 0, call_limit: int = 0, wait_timeout: float = 30.0):
+        """
+        Initialize the budget.
+
+        Args:
+            limit: Global budget in bytes, 0 for accounting only
+            call_limit: Budget of a single call in bytes, 0 for no limit
+            wait_timeout: Seconds a new call waits for memory before it is rejected
+        """
+        self.limit = limit
+        self.call_limit = call_limit
+        self.wait_timeout = wait_timeout
+        self.usage = dict.fromkeys(CATEGORIES, 0)
+        self.peak = 0
+        self.waits = 0
+        self.rejected = 0
+        self._reclaimers: List[Callable[[int], int]] = []
+        self._holders: List[Callable[[], Set[int]]] = []
+        self._released = asyncio.Event()
+
+    @property
+    def total(self) -> int:
+        return sum(self.usage.values())
+
+    def add_reclaimer(self, reclaim: Callable[[int], int]) -> None:
+        """Register a callable freeing at least the given bytes, returning the bytes freed."""
+        self._reclaimers.append(reclaim)
+
+    def add_holder(self, held: Callable[[], Set[int]]) -> None:
+        """Register a callable returning the IDs of objects whose memory it accounts for."""
+        self._holders.append(held)
+
+    def unaccounted_size(self, value: Any) -> int:
+        """
+        Estimate the memory of ``value`` not accounted for by a holder yet.
+
+        A report model sharing its columns with a cached table, for example,
+        only adds the model object itself.
+        """
+        held: Set[int] = set()
+        for holder in self._holders:
+            held |= holder()
+        return estimate_size(value, held)
+
+    def add(self, category: str, nbytes: int) -> None:
+        """Account for memory that is now held."""
+        self.usage[category] += nbytes
+        self.peak = max(self.peak, self.total)
+
+    def remove(self, category: str, nbytes: int) -> None:
+        """Account for memory that was released."""
+        self.usage[category] -= nbytes
+        self._released.set()
+
+    def reclaim(self) -> int:
+        """Ask the reclaimers to bring the total back within the limit."""
+        freed = 0
+        for reclaim in self._reclaimers:
+            excess = self.total - self.limit
+            if not self.limit or excess <= 0:
+                break
+            freed += reclaim(excess)
+        return freed
+
+    def charge(self, category: str, nbytes: int) -> None:
+        """
+        Charge memory to the running call.
+
+        Memory used outside of a tracked call is not held beyond the
+        current request and is not charged. Neither is memory used by
+        background tasks that inherited the context of a call which has
+        already ended.
+
+        Raises:
+            MemoryLimitExceeded: If the call exceeds ``call_limit``
+        """
+        usage = _current_call.get()
+        if usage is None or usage.closed:
+            return
+        usage.by_category[category] += nbytes
+        self.add(category, nbytes)
+        if self.call_limit and usage.total > self.call_limit:
+            raise MemoryLimitExceeded(
+                f"The call needs more than {self.call_limit} bytes of memory; "
+                "narrow the date range, add a limit or use a segment"
+            )
+
+    def release(self, category: str, nbytes: int) -> None:
+        """Return memory charged to the running call with :meth:`charge`."""
+        usage = _current_call.get()
+        if usage is None or usage.closed:
+            return
+        usage.by_category[category] -= nbytes
+        self.remove(category, nbytes)
+
+    async def track(self, work: Awaitable[Any]) -> Any:
+        """Run a call, charging its memory to it until it finishes."""
+        usage = CallUsage()
+        token = _current_call.set(usage)
+        try:
+            return await work
+        finally:
+            _current_call.reset(token)
+            # Tasks spawned by the call keep the usage in their copied context
+            usage.closed = True
+            for category, nbytes in usage.by_category.items():
+                if nbytes:
+                    self.remove(category, nbytes)
+
+    async def admit(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait until the server is within its budget before starting a call.
+
+        Args:
+            timeout: Seconds left until the call's own deadline, if it has one
+
+        Raises:
+            MemoryLimitExceeded: If memory is not released within ``wait_timeout``
+            TimeoutError: If the call's deadline passes first
+        """
+        if not self.limit:
+            return
+        wait = self.wait_timeout if timeout is None else min(self.wait_timeout, timeout)
+        limited_by_call = wait < self.wait_timeout
+        deadline = time.monotonic() + wait
+        waited = False
+        while True:
+            self.reclaim()
+            if self.total <= self.limit:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.rejected += 1
+                if limited_by_call:
+                    raise TimeoutError("The call's deadline passed while waiting for memory")
+                raise MemoryLimitExceeded(
+                    f"The server is using {self.total} of {self.limit} bytes of memory, "
+                    "retry later"
+                )
+            if not waited:
+                self.waits += 1
+                waited = True
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the current usage by category, the peak and backpressure counters."""
+        return {
+            'limit': self.limit or None,
+            'call_limit': self.call_limit or None,
+            'total': self.total,
+            'peak': self.peak,
+            **{f'{category}_bytes': nbytes for category, nbytes in self.usage.items()},
+            'waits': self.waits,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,350 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+# Numeric metrics other than nb_*/sum_* that can be summed across rows
+ADDITIVE_METRICS = {'bounce_count', 'entry_bounce_count', 'exit_nb_visits', 'revenue', 'count'}
+
+
+class _Missing:
+    """Marks a cell of a column the row does not have."""
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return '<missing>'
+
+
+MISSING: Any = _Missing()
+
+
+def is_ratio(metric: str) -> bool:
+    """Return whether a metric is a ratio or average, such as nb_actions_per_visit."""
+    return '_per_' in metric or metric.endswith('_rate') or metric.startswith('avg_')
+
+
+def is_additive(metric: str) -> bool:
+    """Return whether a metric can be summed across rows."""
+    if is_ratio(metric):
+        return False
+    return metric.startswith(('nb_', 'sum_')) or metric in ADDITIVE_METRICS
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def to_number(value: Any) -> Optional[float]:
+    """Convert a Matomo metric value ('45%', '1.5', 12) to a number."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value.rstrip('%'))
+        except ValueError:
+            return None
+    return None
+
+
+class Column:
+    """Typed access to one column of a :class:`ReportTable`."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, table: Optional['ReportTable'], owner: type) -> Any:
+        if table is None:
+            return self
+        return table.column(self.name)
+
+
+class ReportTable:
+    """
+    A flat report stored column-wise.
+
+    Every column is one list holding the values of all rows as Matomo sent
+    them, so converting back with :meth:`to_rows` is lossless, and metric
+    columns can be scanned, sorted and summed without touching row dicts.
+    Tables are never modified in place: :meth:`sort`, :meth:`filter` and
+    :meth:`top` return new tables, so a table can be shared between the
+    response cache and any number of callers.
+    """
+
+    __slots__ = ('columns', 'length')
+
+    label = Column('label')
+    nb_visits = Column('nb_visits')
+    nb_uniq_visitors = Column('nb_uniq_visitors')
+
+    def __init__(self, columns: Dict[str, List[Any]], length: int):
+        """
+        Initialize the table.
+
+        Args:
+            columns: Column name to values, one per row (MISSING where a row
+                has no such column)
+            length: Number of rows
+        """
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def from_rows(cls, rows: Any) -> Optional['ReportTable']:
+        """Build a table from a list of row dicts, or return None if ``rows`` is not one."""
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return None
+
+        columns: Dict[str, List[Any]] = {}
+        for i, row in enumerate(rows):
+            for key, value in row.items():
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = [MISSING] * len(rows)
+                column[i] = value
+        return cls(columns, len(rows))
+
+    @classmethod
+    def view(cls, table: 'ReportTable') -> 'ReportTable':
+        """Return ``table`` typed as ``cls``, sharing its columns."""
+        if type(table) is cls:
+            return table
+        return cls(table.columns, table.length)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self.row(i) for i in range(self.length))
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """Return one row as a new dict."""
+        return {
+            name: column[index]
+            for name, column in self.columns.items()
+            if column[index] is not MISSING
+        }
+
+    def to_rows(self, indices: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+        """Convert all rows, or the rows at ``indices``, into new row dicts."""
+        if indices is None:
+            indices = range(self.length)
+        return [self.row(i) for i in indices]
+
+    def column(self, name: str) -> List[Any]:
+        """
+        Return a copy of the values of a column, None where a row lacks it.
+
+        The copy keeps callers from modifying a table shared with the cache.
+        """
+        column = self.columns.get(name)
+        if column is None:
+            return [None] * self.length
+        return [None if value is MISSING else value for value in column]
+
+    def numbers(self, metric: str) -> List[Optional[float]]:
+        """
+        Return a metric column parsed as numbers ('45%' as 45.0), None where not numeric.
+
+        The list is built on every call rather than kept on the table, so
+        tables shared with the cache do not grow after they were accounted.
+        """
+        column = self.columns.get(metric) or [None] * self.length
+        return [
+            value if _is_number(value) else to_number(value) if value is not MISSING else None
+            for value in column
+        ]
+
+    def select(self, indices: Sequence[int]) -> 'ReportTable':
+        """Return a table of the rows at ``indices``."""
+        return type(self)(
+            {name: [column[i] for i in indices] for name, column in self.columns.items()},
+            len(indices)
+        )
+
+    def order(self, metric: str, descending: bool = True) -> List[int]:
+        """Return the row indices ordered by a metric, ties and missing values in original order."""
+        sign = -1 if descending else 1
+        values = self.numbers(metric)
+        return sorted(range(self.length), key=lambda i: (sign * (values[i] or 0), i))
+
+    def sort(self, metric: Optional[str], descending: bool = True) -> 'ReportTable':
+        """Sort by a numeric metric, keeping the original order for ties and missing values."""
+        if metric is None:
+            return self
+        return self.select(self.order(metric, descending))
+
+    def filter(
+        self,
+        metric: str,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None
+    ) -> 'ReportTable':
+        """Keep the rows whose metric lies within ``[minimum, maximum]``."""
+        values = self.numbers(metric)
+        return self.select([
+            i for i, value in enumerate(values)
+            if value is not None
+            and (minimum is None or value >= minimum)
+            and (maximum is None or value <= maximum)
+        ])
+
+    def where(self, column: str, predicate: Callable[[Any], bool]) -> 'ReportTable':
+        """Keep the rows for which ``predicate`` is true of a column's value."""
+        return self.select([i for i, value in enumerate(self.column(column)) if predicate(value)])
+
+    def top(self, count: int, offset: int = 0) -> 'ReportTable':
+        """Return ``count`` rows starting at ``offset``."""
+        return self.select(range(offset, min(self.length, offset + max(count, 0))))
+
+    def sum(self, metric: str) -> float:
+        """Sum the numeric values of a metric."""
+        total: float = sum(value for value in self.columns.get(metric, ()) if _is_number(value))
+        return total
+
+    def totals(self) -> Dict[str, Any]:
+        """Sum the additive numeric metrics over all rows."""
+        totals: Dict[str, Any] = {}
+        for name, column in self.columns.items():
+            if not is_additive(name):
+                continue
+            numbers = [value for value in column if _is_number(value)]
+            if numbers:
+                total = sum(numbers)
+                totals[name] = round(total, 2) if isinstance(total, float) else total
+        return totals
+
+    def pick_sort_metric(self, candidates: Sequence[str]) -> Optional[str]:
+        """Return the first of ``candidates`` with a numeric value in any row."""
+        for metric in candidates:
+            if any(_is_number(value) for value in self.columns.get(metric, ())):
+                return metric
+        return None
+
+
+class ActionTable(ReportTable):
+    """Rows of Actions reports: page URLs, page titles, entry and exit pages."""
+
+    __slots__ = ()
+
+    url = Column('url')
+    nb_hits = Column('nb_hits')
+    sum_time_spent = Column('sum_time_spent')
+    entry_nb_visits = Column('entry_nb_visits')
+    exit_nb_visits = Column('exit_nb_visits')
+    avg_time_on_page = Column('avg_time_on_page')
+    bounce_rate = Column('bounce_rate')
+    exit_rate = Column('exit_rate')
+
+
+class CountryTable(ReportTable):
+    """Rows of UserCountry reports."""
+
+    __slots__ = ()
+
+    code = Column('code')
+    nb_actions = Column('nb_actions')
+    nb_visits_converted = Column('nb_visits_converted')
+    bounce_count = Column('bounce_count')
+    sum_visit_length = Column('sum_visit_length')
+
+
+class DeviceTable(ReportTable):
+    """Rows of DevicesDetection reports: device types, browsers, operating systems."""
+
+    __slots__ = ()
+
+    nb_actions = Column('nb_actions')
+    nb_visits_converted = Column('nb_visits_converted')
+    bounce_count = Column('bounce_count')
+    sum_visit_length = Column('sum_visit_length')
+
+
+class ReferrerTable(ReportTable):
+    """Rows of Referrers reports."""
+
+    __slots__ = ()
+
+    # Matomo's spelling in Referrers.getAll
+    referrer_type = Column('referer_type')
+    nb_actions = Column('nb_actions')
+    nb_visits_converted = Column('nb_visits_converted')
+    bounce_count = Column('bounce_count')
+    sum_visit_length = Column('sum_visit_length')
+
+
+class VisitsSummary:
+    """The single row of ``VisitsSummary.get`` for one period."""
+
+    FIELDS = (
+        'nb_uniq_visitors', 'nb_users', 'nb_visits', 'nb_actions', 'nb_visits_converted',
+        'bounce_count', 'sum_visit_length', 'max_actions', 'bounce_rate',
+        'nb_actions_per_visit', 'avg_time_on_site',
+    )
+
+    __slots__ = FIELDS + ('extra', '_keys')
+
+    def __init__(self, **values: Any):
+        # Matomo's key order, restored by to_dict
+        self._keys = tuple(values)
+        for field in self.FIELDS:
+            setattr(self, field, values.pop(field, MISSING))
+        # Metrics added by plugins, kept for the round trip
+        self.extra: Dict[str, Any] = values
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'VisitsSummary':
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            key: getattr(self, key) if key in self.FIELDS else self.extra[key]
+            for key in self._keys
+        }
+
+    def metric(self, name: str) -> Optional[float]:
+        """Return a metric as a number, None if missing or not numeric."""
+        value = getattr(self, name) if name in self.FIELDS else self.extra.get(name)
+        return None if value is MISSING else to_number(value)
+
+
+# Model of the flat reports of a module
+TABLE_MODULES = {
+    'Actions': ActionTable,
+    'UserCountry': CountryTable,
+    'DevicesDetection': DeviceTable,
+    'Referrers': ReferrerTable,
+}
+
+
+def to_model(method: str, data: Any) -> Any:
+    """
+    Convert an API response into its typed model.
+
+    Flat reports become :class:`ReportTable` subclasses by module, the
+    visits summary a :class:`VisitsSummary`. Multi-period responses keyed
+    by date are converted value by value. Other data is returned unchanged.
+    """
+    if method == 'VisitsSummary.get' and isinstance(data, dict):
+        if data and all(isinstance(v, (dict, list)) for v in data.values()):
+            return {key: to_model(method, value) for key, value in data.items()}
+        return VisitsSummary.from_dict(data)
+
+    cls = TABLE_MODULES.get(method.split('.', 1)[0], ReportTable)
+    if isinstance(data, ReportTable):
+        return cls.view(data)
+    table = cls.from_rows(data)
+    if table is not None:
+        return table
+    if isinstance(data, dict) and data and all(isinstance(v, list) for v in data.values()):
+        return {key: to_model(method, value) for key, value in data.items()}
+    return data
+
+
+def to_json(value: Any) -> Any:
+    """``default`` hook letting json.dumps encode models."""
+    if isinstance(value, ReportTable):
+        return value.to_rows()
+    if isinstance(value, VisitsSummary):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
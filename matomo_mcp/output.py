@@ -0,0 +1,184 @@
+import base64
+import json
+from typing import Any, Dict, List, Optional
+
+from .models import ReportTable, VisitsSummary, to_json
+
+# Metrics tried in order when no sort metric is given
+DEFAULT_SORT_METRICS = (
+    'nb_visits', 'nb_hits', 'nb_pageviews', 'nb_uniq_visitors', 'nb_actions',
+    'nb_conversions', 'revenue', 'count',
+)
+
+
+def encode_cursor(offset: int, sort_by: Optional[str]) -> str:
+    """Encode a continuation cursor."""
+    raw = json.dumps({'offset': offset, 'sort_by': sort_by}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Decode a continuation cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return {'offset': int(data['offset']), 'sort_by': data.get('sort_by')}
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}") from None
+
+
+def extract_rows(result: Any) -> Optional[List[Dict[str, Any]]]:
+    """
+    Flatten a report into a list of rows.
+
+    Flat reports are lists of rows or tables. Multi-period or multi-site
+    reports are dicts keyed by date or site whose values are rows or lists
+    of rows; their key is kept in a ``key`` column. Periods without data,
+    which Matomo returns as ``[]`` among single rows, become rows holding
+    only their key.
+
+    Returns:
+        The rows, or None if the result is not tabular
+    """
+    if isinstance(result, ReportTable):
+        return result.to_rows()
+
+    if isinstance(result, list):
+        if all(isinstance(row, dict) for row in result):
+            return result
+        return None
+
+    if isinstance(result, dict) and result:
+        values = list(result.values())
+        if all(isinstance(v, (list, ReportTable)) for v in values):
+            return [
+                {'key': key, **row}
+                for key, rows in result.items()
+                for row in rows
+                if isinstance(row, dict)
+            ]
+        if all(isinstance(v, (dict, VisitsSummary)) or _is_empty(v) for v in values):
+            return [
+                {'key': key, **(row.to_dict() if isinstance(row, VisitsSummary) else row or {})}
+                for key, row in result.items()
+            ]
+    return None
+
+
+def _is_empty(value: Any) -> bool:
+    return isinstance(value, (list, ReportTable)) and len(value) == 0
+
+
+def compute_totals(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum the additive numeric metrics over all rows."""
+    return _table(rows).totals()
+
+
+def sort_rows(rows: List[Dict[str, Any]], sort_by: Optional[str]) -> List[Dict[str, Any]]:
+    """Sort rows by a metric, descending, keeping the original order for ties."""
+    if sort_by is None:
+        return rows
+    return [rows[i] for i in _table(rows).order(sort_by)]
+
+
+def pick_sort_metric(rows: List[Dict[str, Any]]) -> Optional[str]:
+    """Choose the default sort metric present in the rows."""
+    return _table(rows).pick_sort_metric(DEFAULT_SORT_METRICS)
+
+
+def _table(rows: List[Dict[str, Any]]) -> ReportTable:
+    return ReportTable.from_rows(rows) or ReportTable({}, 0)
+
+
+def format_result(
+    result: Any,
+    max_bytes: int = 0,
+    max_rows: int = 0,
+    sort_by: Optional[str] = None,
+    cursor: Optional[str] = None
+) -> str:
+    """
+    Serialize a tool result, keeping it within an output budget.
+
+    A result within both limits is returned verbatim, with report models
+    encoded as plain JSON. Otherwise tabular results are replaced by a
+    summary: the rows sorted by ``sort_by``, as many as fit into the
+    budget, the totals over all rows, the row count and a cursor
+    continuing after the returned rows. Non-tabular results are cut off
+    at ``max_bytes``.
+
+    Args:
+        result: The tool result
+        max_bytes: Maximum size of the output in bytes, 0 for no limit
+        max_rows: Maximum number of rows in the output, 0 for no limit
+        sort_by: Metric to order rows by, defaults to the main metric
+        cursor: Continuation cursor from a previous summary
+
+    Returns:
+        The JSON text to return to the client
+    """
+    table = result if isinstance(result, ReportTable) else None
+    rows = extract_rows(result) if table is None else None
+    size = len(table) if table is not None else len(rows) if rows is not None else None
+
+    offset = 0
+    if cursor:
+        position = decode_cursor(cursor)
+        offset = position['offset']
+        sort_by = sort_by or position['sort_by']
+
+    within_rows = not max_rows or size is None or size <= max_rows
+    within_bytes = True
+    text = ''
+    # A table over the row limit is summarized without serializing all of it
+    if within_rows or table is None:
+        text = json.dumps(result, indent=2, default=to_json)
+        within_bytes = not max_bytes or len(text.encode()) <= max_bytes
+    if within_bytes and within_rows and not cursor:
+        return text
+
+    if table is None:
+        if rows is None:
+            return text if within_bytes else _truncate(text, max_bytes)
+        table = _table(rows)
+    sort_by = sort_by or table.pick_sort_metric(DEFAULT_SORT_METRICS)
+    order = table.order(sort_by) if sort_by else list(range(len(table)))
+    totals = table.totals()
+
+    count = len(order) - offset
+    if max_rows:
+        count = min(count, max_rows)
+
+    # Halve the page until the summary fits
+    while True:
+        page = table.to_rows(order[offset:offset + max(count, 0)])
+        end = offset + len(page)
+        summary = {
+            'summary': True,
+            'row_count': len(table),
+            'offset': offset,
+            'returned_rows': len(page),
+            'sort_by': sort_by,
+            'totals': totals,
+            'rows': page,
+            'next_cursor': encode_cursor(end, sort_by) if end < len(table) else None,
+        }
+        text = json.dumps(summary, indent=2, default=to_json)
+        if not max_bytes or len(text.encode()) <= max_bytes:
+            return text
+        if count <= 0:
+            return _truncate(text, max_bytes)
+        count //= 2
+
+
+def _truncate(text: str, max_bytes: int) -> str:
+    data = text.encode()
+    return (
+        data[:max_bytes].decode(errors='ignore')
+        + f"\n... [truncated, {len(data)} bytes in total]"
+    )
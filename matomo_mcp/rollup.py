@@ -0,0 +1,526 @@
+"""
+Cross-site rollups from a local SQLite store.
+
+Questions spanning many sites and months ("total visits of all sites by
+month for the last two years") would take one API call per site and
+period. :class:`Rollup` instead materializes the daily values of a few
+reports for every site into a SQLite database, fetching only the days that
+completed since the previous sync, and answers rollups and rankings with
+local queries. Today, which is not archived yet, is fetched live.
+
+Sync from cron or a systemd timer with::
+
+    MATOMO_URL=... MATOMO_TOKEN=... python -m matomo_mcp.rollup --db rollup.sqlite
+"""
+
+import argparse
+import asyncio
+import sqlite3
+import sys
+from datetime import date as Date
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .client import MatomoClient
+from .compare import comparison_windows, site_today, to_number, window_bounds
+
+# Reports materialized by default, by the name used in queries
+ROLLUP_REPORTS = {
+    'visits': 'VisitsSummary.get',
+    'countries': 'UserCountry.getCountry',
+    'referrer_types': 'Referrers.getReferrerType',
+    'device_types': 'DevicesDetection.getType',
+}
+
+# Stored metrics; only metrics that can be summed across days and sites
+STORED_METRICS = (
+    'nb_visits', 'nb_actions', 'nb_visits_converted', 'bounce_count', 'sum_visit_length',
+)
+
+# Ratios computed from the summed metrics: (numerator, denominator, factor)
+DERIVED_METRICS = {
+    'bounce_rate': ('bounce_count', 'nb_visits', 100),
+    'nb_actions_per_visit': ('nb_actions', 'nb_visits', 1),
+    'avg_time_on_site': ('sum_visit_length', 'nb_visits', 1),
+}
+
+GROUPINGS = ('period', 'site', 'label')
+
+_BUCKETS = {
+    'day': 'date',
+    'week': "date(date, 'weekday 0', '-6 days')",
+    'month': 'substr(date, 1, 7)',
+    'year': 'substr(date, 1, 4)',
+}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sites (
+    idsite INTEGER PRIMARY KEY,
+    name TEXT,
+    timezone TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    report TEXT NOT NULL,
+    idsite INTEGER NOT NULL,
+    synced_until TEXT NOT NULL,
+    PRIMARY KEY (report, idsite)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily (
+    report TEXT NOT NULL,
+    idsite INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    label TEXT NOT NULL,
+    {', '.join(f'{m} REAL' for m in STORED_METRICS)},
+    PRIMARY KEY (report, idsite, date, label)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS daily_by_date ON daily (report, date);
+"""
+
+
+def metric_columns(metrics: Iterable[str]) -> List[str]:
+    """
+    Return the stored columns needed to compute ``metrics``.
+
+    Raises:
+        ValueError: If a metric is neither stored nor derived
+    """
+    columns: List[str] = []
+    for metric in metrics:
+        needed: Tuple[str, ...]
+        if metric in DERIVED_METRICS:
+            needed = DERIVED_METRICS[metric][:2]
+        elif metric in STORED_METRICS:
+            needed = (metric,)
+        else:
+            raise ValueError(
+                f"Unknown rollup metric: {metric}. Available: "
+                f"{', '.join([*STORED_METRICS, *DERIVED_METRICS])}"
+            )
+        columns.extend(c for c in needed if c not in columns)
+    return columns
+
+
+def finish_metrics(sums: Dict[str, float], metrics: Sequence[str]) -> Dict[str, Any]:
+    """Compute the requested metrics from summed columns."""
+    values: Dict[str, Any] = {}
+    for metric in metrics:
+        if metric in DERIVED_METRICS:
+            numerator, denominator, factor = DERIVED_METRICS[metric]
+            total = sums.get(denominator) or 0
+            values[metric] = round(factor * sums.get(numerator, 0) / total, 2) if total else None
+        else:
+            value = sums.get(metric, 0)
+            values[metric] = int(value) if float(value).is_integer() else round(value, 2)
+    return values
+
+
+def bucket(day: Date, granularity: str) -> str:
+    """Return the period bucket of a day, matching the SQL bucket expressions."""
+    if granularity == 'week':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if granularity == 'month':
+        return day.isoformat()[:7]
+    if granularity == 'year':
+        return day.isoformat()[:4]
+    return day.isoformat()
+
+
+def day_rows(result: Any, method: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """Turn the response for one day into ``(label, row)`` pairs."""
+    if method == ROLLUP_REPORTS['visits']:
+        return [('', result)] if isinstance(result, dict) and result else []
+    if isinstance(result, list):
+        return [(str(row.get('label', '')), row) for row in result if isinstance(row, dict)]
+    return []
+
+
+def split_days(start: Date, end: Date, max_days: int) -> List[Tuple[Date, Date]]:
+    """Split an inclusive date range into ranges of at most ``max_days`` days."""
+    ranges = []
+    while start <= end:
+        stop = min(end, start + timedelta(days=max_days - 1))
+        ranges.append((start, stop))
+        start = stop + timedelta(days=1)
+    return ranges
+
+
+class RollupStore:
+    """SQLite database holding daily report values of all sites."""
+
+    def __init__(self, path: str):
+        """
+        Open or create the store.
+
+        Args:
+            path: Database file, or ':memory:'
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def save_sites(self, sites: List[Dict[str, Any]]) -> None:
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO sites (idsite, name, timezone) VALUES (?, ?, ?)",
+                [(int(s['idsite']), s.get('name'), s.get('timezone')) for s in sites]
+            )
+
+    def sites(self) -> Dict[int, Dict[str, Any]]:
+        """Return the known sites by ID."""
+        return {
+            idsite: {'name': name, 'timezone': tz}
+            for idsite, name, tz in self.db.execute("SELECT idsite, name, timezone FROM sites")
+        }
+
+    def synced_until(self, report: str, site_id: int) -> Optional[Date]:
+        row = self.db.execute(
+            "SELECT synced_until FROM sync_state WHERE report = ? AND idsite = ?",
+            (report, site_id)
+        ).fetchone()
+        return Date.fromisoformat(row[0]) if row else None
+
+    def write_days(
+        self,
+        report: str,
+        site_id: int,
+        days: Dict[str, List[Tuple[str, Dict[str, Any]]]],
+        synced_until: Date
+    ) -> int:
+        """
+        Store the rows of complete days and advance the sync state.
+
+        Days already stored are replaced as a whole, so a re-fetched day
+        also loses labels that are no longer reported.
+
+        Returns:
+            The number of rows written
+        """
+        records = [
+            (report, site_id, day, label, *(to_number(row.get(m)) or 0 for m in STORED_METRICS))
+            for day, rows in days.items()
+            for label, row in rows
+        ]
+        placeholders = ', '.join('?' * (4 + len(STORED_METRICS)))
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM daily WHERE report = ? AND idsite = ? AND date = ?",
+                [(report, site_id, day) for day in days]
+            )
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO daily VALUES ({placeholders})", records
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO sync_state (report, idsite, synced_until) VALUES (?, ?, ?)",
+                (report, site_id, synced_until.isoformat())
+            )
+        return len(records)
+
+    def aggregate(
+        self,
+        report: str,
+        columns: List[str],
+        start: Date,
+        end: Date,
+        group_by: str,
+        granularity: str,
+        site_ids: Optional[List[int]] = None
+    ) -> Dict[Any, Dict[str, float]]:
+        """Sum stored columns over a date range, grouped by period, site or label."""
+        key = {'period': _BUCKETS[granularity], 'site': 'idsite', 'label': 'label'}[group_by]
+        sql = (
+            f"SELECT {key}, {', '.join(f'SUM({c})' for c in columns)} FROM daily "
+            "WHERE report = ? AND date BETWEEN ? AND ?"
+        )
+        params: List[Any] = [report, start.isoformat(), end.isoformat()]
+        if site_ids:
+            sql += f" AND idsite IN ({', '.join('?' * len(site_ids))})"
+            params.extend(site_ids)
+        sql += " GROUP BY 1"
+        return {
+            row[0]: dict(zip(columns, row[1:], strict=True))
+            for row in self.db.execute(sql, params)
+        }
+
+    def oldest_sync(self, report: str, site_ids: Optional[List[int]] = None) -> Optional[str]:
+        """Return the earliest sync date of the given sites, None if one was never synced."""
+        sql = "SELECT idsite FROM sites"
+        params: List[Any] = []
+        if site_ids:
+            sql += f" WHERE idsite IN ({', '.join('?' * len(site_ids))})"
+            params.extend(site_ids)
+        dates = [self.synced_until(report, idsite) for (idsite,) in self.db.execute(sql, params)]
+        if not dates or None in dates:
+            return None
+        return min(d for d in dates if d is not None).isoformat()
+
+
+class Rollup:
+    """
+    Materialize daily reports of all sites and answer cross-site queries.
+
+    Each sync requests, per site and report, only the days after the last
+    synced day up to yesterday in the site timezone, plus the last
+    ``refetch_days`` days again: without browser-triggered archiving, a
+    sync shortly after midnight may see a day whose archive does not yet
+    cover all of it, and re-fetching replaces those totals. The day ranges are
+    fetched with ``period=day`` in bulk requests of up to ``chunk_size``
+    sites and reports.
+    """
+
+    def __init__(
+        self,
+        client: MatomoClient,
+        store: RollupStore,
+        reports: Optional[List[str]] = None,
+        backfill_days: int = 730,
+        refetch_days: int = 2,
+        max_days: int = 92,
+        chunk_size: int = 20
+    ):
+        """
+        Initialize the rollup.
+
+        Args:
+            client: Client used to sync and to fetch today
+            store: Local store
+            reports: Names of the reports to materialize (keys of ROLLUP_REPORTS)
+            backfill_days: Days fetched for a site on its first sync
+            refetch_days: Trailing days fetched again on every sync
+            max_days: Maximum number of days per request
+            chunk_size: Maximum number of requests per bulk request
+
+        Raises:
+            ValueError: If a report is unknown
+        """
+        reports = reports or list(ROLLUP_REPORTS)
+        unknown = [r for r in reports if r not in ROLLUP_REPORTS]
+        if unknown:
+            raise ValueError(f"Unknown rollup reports: {', '.join(unknown)}")
+        self.client = client
+        self.store = store
+        self.reports = reports
+        self.backfill_days = backfill_days
+        self.refetch_days = refetch_days
+        self.max_days = max_days
+        self.chunk_size = chunk_size
+        self._lock = asyncio.Lock()
+
+    async def sync(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Fetch all days completed since the previous sync, and the last
+        ``refetch_days`` days again.
+
+        Args:
+            now: Current time, defaults to the system clock
+
+        Returns:
+            Counts of sites, requests, days and rows synced
+        """
+        async with self._lock:
+            sites = await self.client.call_api(
+                'SitesManager.getSitesWithAtLeastViewAccess', use_cache=False
+            )
+            self.store.save_sites(sites)
+
+            # (report, site_id, start, end) of every missing day range
+            pending = []
+            for site in sites:
+                site_id = int(site['idsite'])
+                yesterday = site_today(site.get('timezone'), now) - timedelta(days=1)
+                earliest = yesterday - timedelta(days=self.backfill_days - 1)
+                created = str(site.get('ts_created') or '')[:10]
+                if created:
+                    earliest = max(earliest, Date.fromisoformat(created))
+                for report in self.reports:
+                    synced = self.store.synced_until(report, site_id)
+                    start = earliest
+                    if synced:
+                        refetch_from = yesterday - timedelta(days=self.refetch_days - 1)
+                        start = max(earliest, min(synced + timedelta(days=1), refetch_from))
+                    for first, last in split_days(start, yesterday, self.max_days):
+                        pending.append((report, site_id, first, last))
+
+            rows = days = 0
+            for i in range(0, len(pending), self.chunk_size):
+                chunk = pending[i:i + self.chunk_size]
+                results = await self.client.bulk_request([
+                    (ROLLUP_REPORTS[report], {
+                        'idSite': site_id,
+                        'period': 'day',
+                        'date': f"{first.isoformat()},{last.isoformat()}",
+                        'filter_limit': -1,
+                    })
+                    for report, site_id, first, last in chunk
+                ], use_cache=False)
+
+                for (report, site_id, first, last), result in zip(chunk, results, strict=True):
+                    # A single day may come back without the date key
+                    if first == last and not (isinstance(result, dict) and first.isoformat() in result):
+                        result = {first.isoformat(): result}
+                    per_day = {
+                        day: day_rows(value, ROLLUP_REPORTS[report])
+                        for day, value in (result.items() if isinstance(result, dict) else ())
+                    }
+                    rows += self.store.write_days(report, site_id, per_day, last)
+                    days += (last - first).days + 1
+
+            return {'sites': len(sites), 'requests': len(pending), 'days': days, 'rows': rows}
+
+    async def query(
+        self,
+        report: str = 'visits',
+        metrics: Optional[List[str]] = None,
+        granularity: str = 'month',
+        date: str = 'last12',
+        group_by: str = 'period',
+        site_ids: Optional[List[int]] = None,
+        limit: int = 10,
+        include_today: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Roll up or rank stored values.
+
+        Args:
+            report: Name of a materialized report (e.g. 'visits', 'countries')
+            metrics: Metrics to return, stored or derived (default: nb_visits)
+            granularity: Period buckets for ``group_by='period'``: day, week, month or year
+            date: Date, date range or lastN/previousN in units of ``granularity``
+            group_by: 'period' for a time series over all sites, 'site' or
+                'label' for a ranking
+            site_ids: Restrict to these sites (default: all)
+            limit: Number of ranked rows
+            include_today: Fetch today live when the date range includes it
+
+        Returns:
+            The grouped rows and the sync state of the store
+
+        Raises:
+            ValueError: If an argument is invalid
+        """
+        if report not in ROLLUP_REPORTS:
+            raise ValueError(f"Unknown rollup report: {report}")
+        if group_by not in GROUPINGS:
+            raise ValueError(f"group_by must be one of: {', '.join(GROUPINGS)}")
+        if granularity not in _BUCKETS:
+            raise ValueError(f"granularity must be one of: {', '.join(_BUCKETS)}")
+        metrics = metrics or ['nb_visits']
+        columns = metric_columns(metrics)
+
+        start, end = window_bounds(
+            comparison_windows(granularity, date, datetime.now(timezone.utc).date())[0]
+        )
+        sums = self.store.aggregate(report, columns, start, end, group_by, granularity, site_ids)
+
+        live_sites = 0
+        if include_today:
+            live_sites = await self._add_today(
+                sums, report, columns, start, end, group_by, granularity, site_ids
+            )
+
+        keys = list(sums)
+        if group_by == 'period':
+            keys.sort()
+        else:
+            keys.sort(key=lambda k: -(sums[k].get(columns[0]) or 0))
+            keys = keys[:limit]
+
+        sites = self.store.sites()
+        rows = []
+        for key in keys:
+            row: Dict[str, Any] = {group_by: key}
+            if group_by == 'site':
+                row['name'] = sites.get(key, {}).get('name')
+            row.update(finish_metrics(sums[key], metrics))
+            rows.append(row)
+
+        return {
+            'report': report,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'group_by': group_by,
+            'synced_until': self.store.oldest_sync(report, site_ids),
+            'live_sites': live_sites,
+            'rows': rows,
+        }
+
+    async def _add_today(
+        self,
+        sums: Dict[Any, Dict[str, float]],
+        report: str,
+        columns: List[str],
+        start: Date,
+        end: Date,
+        group_by: str,
+        granularity: str,
+        site_ids: Optional[List[int]]
+    ) -> int:
+        """Add today's live values of every site whose today is in range."""
+        targets = [
+            (site_id, today)
+            for site_id, site in self.store.sites().items()
+            if not site_ids or site_id in site_ids
+            for today in [site_today(site['timezone'])]
+            if start <= today <= end
+        ]
+        method = ROLLUP_REPORTS[report]
+        for i in range(0, len(targets), self.chunk_size):
+            chunk = targets[i:i + self.chunk_size]
+            results = await self.client.bulk_request([
+                (method, {'idSite': site_id, 'period': 'day', 'date': 'today', 'filter_limit': -1})
+                for site_id, _ in chunk
+            ])
+            for (site_id, today), result in zip(chunk, results, strict=True):
+                for label, row in day_rows(result, method):
+                    key = {'period': bucket(today, granularity), 'site': site_id, 'label': label}[group_by]
+                    target = sums.setdefault(key, dict.fromkeys(columns, 0))
+                    for column in columns:
+                        target[column] = (target[column] or 0) + (to_number(row.get(column)) or 0)
+        return len(targets)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        prog="python -m matomo_mcp.rollup",
+        description="Sync the daily reports of all Matomo sites into a local rollup store."
+    )
+    parser.add_argument("--db", required=True, help="SQLite database file")
+    parser.add_argument("--reports", nargs="+", choices=list(ROLLUP_REPORTS),
+                        help="reports to materialize (default: all)")
+    parser.add_argument("--backfill-days", type=int, default=730,
+                        help="days fetched for sites synced for the first time (default: 730)")
+    parser.add_argument("--refetch-days", type=int, default=2,
+                        help="trailing days fetched again on every sync (default: 2)")
+    args = parser.parse_args(argv)
+
+    from .server import get_client
+
+    async def run() -> Dict[str, Any]:
+        client = get_client()
+        store = RollupStore(args.db)
+        try:
+            rollup = Rollup(
+                client,
+                store,
+                args.reports,
+                backfill_days=args.backfill_days,
+                refetch_days=args.refetch_days
+            )
+            return await rollup.sync()
+        finally:
+            store.close()
+            await client.aclose()
+
+    stats = asyncio.run(run())
+    print(
+        f"Synced {stats['sites']} sites: {stats['requests']} requests, "
+        f"{stats['days']} site-days, {stats['rows']} rows"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
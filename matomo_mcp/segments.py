@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import re
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+from urllib.parse import quote, unquote
+
+if TYPE_CHECKING:
+    from .client import MatomoClient
+
+logger = logging.getLogger("matomo-mcp")
+
+# Matomo segment operators, longest first so '==' wins over '='
+_CONDITION = re.compile(r'^\s*([A-Za-z0-9_.]+)\s*(==|!=|<=|>=|=@|!@|=\^|=\$|<|>)(.*)$', re.S)
+
+
+def canonicalize_segment(segment: Optional[str]) -> Optional[str]:
+    """
+    Bring a Matomo segment definition into a canonical form.
+
+    Conditions are trimmed and their values URL-encoded consistently, OR
+    groups (``,``) and AND groups (``;``) are sorted and de-duplicated.
+    Equivalent definitions therefore map to the same string, e.g.
+    ``"deviceType==smartphone; browserName==Chrome"`` and
+    ``"browserName==Chrome;deviceType==smartphone"``.
+
+    Args:
+        segment: Segment definition as passed to the API
+
+    Returns:
+        The canonical definition, or None for an empty segment
+
+    Raises:
+        ValueError: If a condition cannot be parsed
+    """
+    if segment is None or not segment.strip():
+        return None
+
+    and_groups = set()
+    for and_part in segment.split(';'):
+        or_terms = set()
+        for term in and_part.split(','):
+            if not term.strip():
+                continue
+            match = _CONDITION.match(term)
+            if match is None:
+                raise ValueError(f"Invalid segment condition: {term.strip()!r}")
+            dimension, operator, value = match.groups()
+            value = quote(unquote(value.strip()), safe='')
+            or_terms.add(f"{dimension}{operator}{value}")
+        if or_terms:
+            and_groups.add(','.join(sorted(or_terms)))
+
+    if not and_groups:
+        return None
+    return ';'.join(sorted(and_groups))
+
+
+class SegmentStats:
+    """Usage and cache statistics for one canonical segment."""
+
+    def __init__(self, definition: str):
+        self.definition = definition
+        self.uses = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.uses_by_site: Dict[str, int] = {}
+        self.registered_sites: Set[str] = set()
+        self.last_used: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        total = self.cache_hits + self.cache_misses
+        return {
+            'definition': self.definition,
+            'uses': self.uses,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'hit_rate': round(self.cache_hits / total, 3) if total else None,
+            'uses_by_site': dict(self.uses_by_site),
+            'registered_sites': sorted(self.registered_sites),
+            'last_used': self.last_used,
+        }
+
+
+class SegmentRegistry:
+    """
+    Track segment usage and pre-register frequently used segments.
+
+    Matomo processes segments that are not stored in the Segment Editor in
+    real time on every request. Once a segment has been used
+    ``register_after`` times for a site, it is added with ``autoArchive=1``
+    so that subsequent requests are served from pre-built archives.
+    """
+
+    def __init__(self, auto_register: bool = False, register_after: int = 3):
+        """
+        Initialize the registry.
+
+        Args:
+            auto_register: Whether to add frequently used segments to Matomo
+            register_after: Number of uses per site before a segment is added
+        """
+        self.auto_register = auto_register
+        self.register_after = register_after
+        self._stats: Dict[str, SegmentStats] = {}
+        # Site -> canonical definition -> spelling stored in the Segment Editor
+        self._known: Dict[str, Dict[str, str]] = {}
+        self._pending: Set[asyncio.Task] = set()
+
+    def record(self, definition: str, site_id: Any, cache_hit: bool) -> SegmentStats:
+        """Record one request using a canonical segment definition."""
+        stats = self._stats.get(definition)
+        if stats is None:
+            stats = self._stats[definition] = SegmentStats(definition)
+
+        stats.uses += 1
+        stats.last_used = time.time()
+        if cache_hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+        if site_id is not None:
+            site = str(site_id)
+            stats.uses_by_site[site] = stats.uses_by_site.get(site, 0) + 1
+        return stats
+
+    def schedule_registration(
+        self,
+        client: "MatomoClient",
+        stats: SegmentStats,
+        site_id: Any
+    ) -> None:
+        """Register the segment in the background if it is used often enough."""
+        if not self.auto_register or site_id is None:
+            return
+        site = str(site_id)
+        if site in stats.registered_sites:
+            return
+        if stats.uses_by_site.get(site, 0) < self.register_after:
+            return
+
+        # Mark first so concurrent requests do not register twice
+        stats.registered_sites.add(site)
+        task = asyncio.ensure_future(self._register(client, stats, site))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def spelling(
+        self,
+        client: "MatomoClient",
+        definition: str,
+        original: str,
+        site_id: Any
+    ) -> str:
+        """
+        Return the spelling under which to send a segment to Matomo.
+
+        Matomo matches stored segments and their archives by the exact
+        definition string, so an equivalent stored segment is sent exactly
+        as stored. Otherwise the caller's spelling is kept.
+
+        Args:
+            client: Matomo client used to list the stored segments once per site
+            definition: Canonical definition
+            original: Definition as passed by the caller
+            site_id: Site the request is for
+        """
+        if site_id is None:
+            return original
+        try:
+            known = await self._known_segments(client, str(site_id))
+        except Exception as e:
+            logger.debug(f"Could not list stored segments of site {site_id}: {str(e)}")
+            return original
+        return known.get(definition, original)
+
+    async def _register(self, client: "MatomoClient", stats: SegmentStats, site: str) -> None:
+        try:
+            if stats.definition in await self._known_segments(client, site):
+                return
+            await client.call_api('SegmentEditor.add', {
+                'name': f"MCP: {unquote(stats.definition)}"[:255],
+                'definition': stats.definition,
+                'idSite': site,
+                'autoArchive': 1,
+                'enabledAllUsers': 0,
+            })
+            self._known[site][stats.definition] = stats.definition
+            logger.info(f"Registered segment {stats.definition!r} for site {site}")
+        except Exception as e:
+            stats.registered_sites.discard(site)
+            logger.warning(f"Could not register segment {stats.definition!r}: {str(e)}")
+
+    async def _known_segments(self, client: "MatomoClient", site: str) -> Dict[str, str]:
+        if site not in self._known:
+            stored = await client.call_api('SegmentEditor.getAll', {'idSite': site})
+            known: Dict[str, str] = {}
+            for segment in stored if isinstance(stored, list) else []:
+                spelling = segment.get('definition') if isinstance(segment, dict) else None
+                try:
+                    definition = canonicalize_segment(spelling)
+                except ValueError:
+                    continue
+                if definition and spelling:
+                    known.setdefault(definition, spelling)
+            self._known[site] = known
+        return self._known[site]
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Return per-segment statistics, most used first."""
+        return [
+            s.to_dict()
+            for s in sorted(self._stats.values(), key=lambda s: s.uses, reverse=True)
+        ]
@@ -1,12 +1,21 @@
 import json
 import logging
 import os
+import time
 from typing import Any, Optional
 
 from mcp.server import Server
 from mcp.types import TextContent, Tool
 
+from .cache import ResponseCache
 from .client import MatomoClient
+from .jobs import Job, JobManager, make_request_key
+from .live import LiveTracker
+from .memory import MemoryBudget
+from .output import format_result
+from .rollup import ROLLUP_REPORTS, Rollup, RollupStore
+from .segments import SegmentRegistry
+from .transport import HttpxTransport, RecordingTransport, ReplayTransport, Transport
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +27,60 @@ app = Server("matomo-mcp")
 # Global client instance
 matomo_client: Optional[MatomoClient] = None
 
+# Default output budget per tool call, 0 disables the limit
+MAX_OUTPUT_BYTES = int(os.getenv("MATOMO_MAX_OUTPUT_BYTES", "50000"))
+MAX_ROWS = int(os.getenv("MATOMO_MAX_ROWS", "100"))
+
+# Arguments controlling the output budget, accepted by every reporting tool
+OUTPUT_ARGUMENTS = ("max_output_bytes", "max_rows", "sort_by", "cursor")
+OUTPUT_PROPERTIES = {
+    "max_output_bytes": {
+        "type": "integer",
+        "description": "Maximum size of the result in bytes; larger results are summarized (default: server setting, 0 for no limit)"
+    },
+    "max_rows": {
+        "type": "integer",
+        "description": "Maximum number of rows in the result; larger results are summarized (default: server setting, 0 for no limit)"
+    },
+    "sort_by": {
+        "type": "string",
+        "description": "Metric used to pick the top rows of a summarized result (e.g., 'nb_visits')"
+    },
+    "cursor": {
+        "type": "string",
+        "description": "Continuation cursor from a summarized result, returns the next rows"
+    }
+}
+
+# Per-call deadline, accepted by every tool calling Matomo
+TIMEOUT_PROPERTIES = {
+    "timeout_ms": {
+        "type": "integer",
+        "description": "Deadline for the call in milliseconds; the Matomo requests are aborted when it passes"
+    }
+}
+
+# Live visitor tracker, created together with the client on first use
+live_tracker: Optional[LiveTracker] = None
+
+# Memory budget shared by all calls and the cache, 0 MB for accounting only
+memory_budget = MemoryBudget(
+    limit=int(float(os.getenv("MATOMO_MEMORY_LIMIT_MB", "0")) * 1024 * 1024),
+    call_limit=int(float(os.getenv("MATOMO_CALL_MEMORY_LIMIT_MB", "0")) * 1024 * 1024),
+    wait_timeout=float(os.getenv("MATOMO_MEMORY_WAIT", "30"))
+)
+
+# Cross-site rollup store, enabled by MATOMO_ROLLUP_DB
+rollup: Optional[Rollup] = None
+
+# Calls taking longer than MATOMO_JOB_THRESHOLD seconds continue as background jobs
+job_manager = JobManager(
+    threshold=float(os.getenv("MATOMO_JOB_THRESHOLD", "20")),
+    retention=float(os.getenv("MATOMO_JOB_RETENTION", "600")),
+    max_jobs=int(os.getenv("MATOMO_MAX_JOBS", "100")),
+    budget=memory_budget
+)
+
 
 def get_client() -> MatomoClient:
     """Get or create the Matomo client instance."""
@@ -25,17 +88,94 @@ def get_client() -> MatomoClient:
     if matomo_client is None:
         base_url = os.getenv("MATOMO_URL")
         token = os.getenv("MATOMO_TOKEN")
+        replay = os.getenv("MATOMO_REPLAY")
+
+        # Replayed cassettes contain no token and need no reachable instance
+        if replay:
+            base_url = base_url or "http://matomo.replay"
+            token = token or "replay"
 
         if not base_url or not token:
             raise ValueError(
                 "MATOMO_URL and MATOMO_TOKEN environment variables must be set"
             )
 
-        matomo_client = MatomoClient(base_url, token)
+        # Background jobs may outlive the foreground threshold, so the
+        # request timeout is deliberately longer than a tool call should block
+        timeout = float(os.getenv("MATOMO_TIMEOUT", "300"))
+
+        cache = None
+        cache_ttl = float(os.getenv("MATOMO_CACHE_TTL", "300"))
+        if cache_ttl > 0:
+            cache = ResponseCache(
+                ttl=cache_ttl,
+                max_entries=int(os.getenv("MATOMO_CACHE_SIZE", "1000")),
+                max_bytes=int(float(os.getenv("MATOMO_CACHE_MAX_MB", "0")) * 1024 * 1024),
+                budget=memory_budget
+            )
+
+        # Kept job results are only dropped when evicting the cache was not enough
+        memory_budget.add_reclaimer(job_manager.shrink)
+
+        segments = SegmentRegistry(
+            auto_register=os.getenv("MATOMO_SEGMENT_AUTO_REGISTER", "").lower() in ("1", "true", "yes"),
+            register_after=int(os.getenv("MATOMO_SEGMENT_REGISTER_AFTER", "3"))
+        )
+
+        transport: Transport
+        if replay:
+            transport = ReplayTransport(
+                replay,
+                speed=float(os.getenv("MATOMO_REPLAY_SPEED", "1"))
+            )
+        else:
+            transport = HttpxTransport(
+                max_response_bytes=int(float(os.getenv("MATOMO_MAX_RESPONSE_MB", "0")) * 1024 * 1024)
+            )
+            if os.getenv("MATOMO_RECORD"):
+                transport = RecordingTransport(transport, os.environ["MATOMO_RECORD"])
+
+        matomo_client = MatomoClient(
+            base_url,
+            token,
+            timeout=timeout,
+            cache=cache,
+            segments=segments,
+            transport=transport,
+            memory=memory_budget
+        )
 
     return matomo_client
 
 
+def get_live_tracker() -> LiveTracker:
+    """Get or create the Live visitor tracker."""
+    global live_tracker
+    if live_tracker is None:
+        live_tracker = LiveTracker(
+            get_client(),
+            buffer_size=int(os.getenv("MATOMO_LIVE_BUFFER_SIZE", "1000")),
+            max_minutes=int(os.getenv("MATOMO_LIVE_MAX_MINUTES", "60"))
+        )
+    return live_tracker
+
+
+def get_rollup() -> Rollup:
+    """Get or create the cross-site rollup."""
+    global rollup
+    if rollup is None:
+        path = os.getenv("MATOMO_ROLLUP_DB")
+        if not path:
+            raise ValueError("MATOMO_ROLLUP_DB environment variable must be set to use rollups")
+        rollup = Rollup(
+            get_client(),
+            RollupStore(path),
+            backfill_days=int(os.getenv("MATOMO_ROLLUP_BACKFILL_DAYS", "730")),
+            refetch_days=int(os.getenv("MATOMO_ROLLUP_REFETCH_DAYS", "2"))
+        )
+    return rollup
+
+
 @app.list_tools()
 async def list_tools() -> list[Tool]:
     """List available Matomo reporting tools."""
@@ -49,7 +189,8 @@ async def list_tools() -> list[Tool]:
                     "site_id": {
                         "type": "integer",
                         "description": "The ID of the Matomo site"
-                    }
+                    },
+                    **TIMEOUT_PROPERTIES
                 },
                 "required": ["site_id"]
             }
@@ -74,7 +215,9 @@ async def list_tools() -> list[Tool]:
                         "type": "string",
                         "description": "Date or date range (e.g., '2024-01-01', 'last30', 'today', '2024-01-01,2024-01-31')",
                         "default": "today"
-                    }
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
                 },
                 "required": ["site_id"]
             }
@@ -104,7 +247,9 @@ async def list_tools() -> list[Tool]:
                         "type": "integer",
                         "description": "Maximum number of results to return",
                         "default": 10
-                    }
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
                 },
                 "required": ["site_id"]
             }
@@ -134,7 +279,9 @@ async def list_tools() -> list[Tool]:
                         "type": "integer",
                         "description": "Maximum number of results to return",
                         "default": 10
-                    }
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
                 },
                 "required": ["site_id"]
             }
@@ -159,7 +306,9 @@ async def list_tools() -> list[Tool]:
                         "type": "string",
                         "description": "Date or date range",
                         "default": "today"
-                    }
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
                 },
                 "required": ["site_id"]
             }
@@ -184,7 +333,9 @@ async def list_tools() -> list[Tool]:
                         "type": "string",
                         "description": "Date or date range",
                         "default": "today"
-                    }
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
                 },
                 "required": ["site_id"]
             }
@@ -214,7 +365,9 @@ async def list_tools() -> list[Tool]:
                         "type": "integer",
                         "description": "Maximum number of results to return",
                         "default": 10
-                    }
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
                 },
                 "required": ["site_id"]
             }
@@ -247,115 +400,578 @@ async def list_tools() -> list[Tool]:
                     "additional_params": {
                         "type": "string",
                         "description": "Additional parameters as JSON string (e.g., '{\"segment\": \"browserName==Chrome\"}')"
-                    }
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
                 },
                 "required": ["method", "site_id"]
             }
+        ),
+        Tool(
+            name="compare_periods",
+            description="Compare a report with the preceding period (e.g. this week vs last week) and return only the changes and percent changes of each metric. Both periods are fetched in parallel; the previous period is computed in the site's timezone.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "site_id": {
+                        "type": "integer",
+                        "description": "The ID of the Matomo site"
+                    },
+                    "method": {
+                        "type": "string",
+                        "description": "Report method to compare (e.g., 'VisitsSummary.get', 'UserCountry.getCountry', 'Actions.getPageTitles')",
+                        "default": "VisitsSummary.get"
+                    },
+                    "period": {
+                        "type": "string",
+                        "description": "Time period: day, week, month, year, or range",
+                        "enum": ["day", "week", "month", "year", "range"],
+                        "default": "day"
+                    },
+                    "date": {
+                        "type": "string",
+                        "description": "Date or date range of the current period (e.g., 'yesterday', '2024-03-01', 'last7', '2024-01-01,2024-01-31')",
+                        "default": "yesterday"
+                    },
+                    "segment": {
+                        "type": "string",
+                        "description": "Optional segment definition (e.g., 'browserName==Chrome')"
+                    },
+                    "metrics": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Metrics to compare (default: all numeric metrics)"
+                    },
+                    "join_rows": {
+                        "type": "boolean",
+                        "description": "For flat reports, also compare row by row on the label",
+                        "default": False
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of compared rows when join_rows is set",
+                        "default": 10
+                    },
+                    **TIMEOUT_PROPERTIES
+                },
+                "required": ["site_id"]
+            }
+        ),
+        Tool(
+            name="browse_report",
+            description="Get the top level of a hierarchical report (e.g. page URLs by folder, referrer types) without expanding it. Rows with children include an 'idsubdatatable' handle to pass to get_subtables.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "site_id": {
+                        "type": "integer",
+                        "description": "The ID of the Matomo site"
+                    },
+                    "method": {
+                        "type": "string",
+                        "description": "Hierarchical report method (e.g., 'Actions.getPageUrls', 'Actions.getPageTitles', 'Referrers.getReferrerType', 'Referrers.getWebsites')",
+                        "default": "Actions.getPageUrls"
+                    },
+                    "period": {
+                        "type": "string",
+                        "description": "Time period: day, week, month, year, or range",
+                        "enum": ["day", "week", "month", "year", "range"],
+                        "default": "day"
+                    },
+                    "date": {
+                        "type": "string",
+                        "description": "Date or date range",
+                        "default": "today"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of results to return",
+                        "default": 10
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
+                },
+                "required": ["site_id"]
+            }
+        ),
+        Tool(
+            name="get_subtables",
+            description="Expand specific rows of a hierarchical report returned by browse_report (or a previous get_subtables call) by their 'idsubdatatable' handles. Several subtables are fetched in one request.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "site_id": {
+                        "type": "integer",
+                        "description": "The ID of the Matomo site"
+                    },
+                    "method": {
+                        "type": "string",
+                        "description": "Report method of the parent table",
+                        "default": "Actions.getPageUrls"
+                    },
+                    "subtable_ids": {
+                        "type": "array",
+                        "items": {"type": "integer"},
+                        "description": "The 'idsubdatatable' values of the rows to expand"
+                    },
+                    "period": {
+                        "type": "string",
+                        "description": "Time period: day, week, month, year, or range",
+                        "enum": ["day", "week", "month", "year", "range"],
+                        "default": "day"
+                    },
+                    "date": {
+                        "type": "string",
+                        "description": "Date or date range",
+                        "default": "today"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of rows per subtable",
+                        "default": 10
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
+                },
+                "required": ["site_id", "subtable_ids"]
+            }
+        ),
+        Tool(
+            name="get_goal_conversions",
+            description="Get conversions, conversion rate and revenue for every goal of a site in one table, joined with the goal names and definitions. Optionally includes e-commerce orders and abandoned carts.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "site_id": {
+                        "type": "integer",
+                        "description": "The ID of the Matomo site"
+                    },
+                    "period": {
+                        "type": "string",
+                        "description": "Time period: day, week, month, year, or range",
+                        "enum": ["day", "week", "month", "year", "range"],
+                        "default": "day"
+                    },
+                    "date": {
+                        "type": "string",
+                        "description": "Date or date range",
+                        "default": "today"
+                    },
+                    "segment": {
+                        "type": "string",
+                        "description": "Optional segment definition (e.g., 'browserName==Chrome')"
+                    },
+                    "ecommerce": {
+                        "type": "boolean",
+                        "description": "Also include e-commerce orders and abandoned carts",
+                        "default": False
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
+                },
+                "required": ["site_id"]
+            }
+        ),
+        Tool(
+            name="get_ecommerce_items",
+            description="Get e-commerce product statistics (quantity, revenue, orders, conversion rate) by SKU, product name, or category",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "site_id": {
+                        "type": "integer",
+                        "description": "The ID of the Matomo site"
+                    },
+                    "period": {
+                        "type": "string",
+                        "description": "Time period: day, week, month, year, or range",
+                        "enum": ["day", "week", "month", "year", "range"],
+                        "default": "day"
+                    },
+                    "date": {
+                        "type": "string",
+                        "description": "Date or date range",
+                        "default": "today"
+                    },
+                    "dimension": {
+                        "type": "string",
+                        "description": "Group items by SKU, name, or category",
+                        "enum": ["sku", "name", "category"],
+                        "default": "sku"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of results to return",
+                        "default": 10
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
+                },
+                "required": ["site_id"]
+            }
+        ),
+        Tool(
+            name="get_live_visitors",
+            description="Get real-time activity of the last minutes: visits, visitors, top pages, countries, devices, and the most recent visits. Only new visits are fetched from Matomo on each call.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "site_id": {
+                        "type": "integer",
+                        "description": "The ID of the Matomo site"
+                    },
+                    "minutes": {
+                        "type": "integer",
+                        "description": "Size of the time window in minutes",
+                        "default": 30
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of entries in each top list",
+                        "default": 10
+                    },
+                    **TIMEOUT_PROPERTIES
+                },
+                "required": ["site_id"]
+            }
+        ),
+        Tool(
+            name="sync_rollup",
+            description="Sync the daily visits and key reports of all sites into the local rollup store (MATOMO_ROLLUP_DB). Only days completed since the previous sync are fetched.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    **TIMEOUT_PROPERTIES
+                },
+                "required": []
+            }
+        ),
+        Tool(
+            name="query_rollup",
+            description="Answer portfolio-wide questions across all sites from the local rollup store: totals per period (e.g. visits of all sites by month) or rankings of sites or report labels. Today is fetched live.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "report": {
+                        "type": "string",
+                        "description": "Materialized report",
+                        "enum": list(ROLLUP_REPORTS),
+                        "default": "visits"
+                    },
+                    "metrics": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Metrics: nb_visits, nb_actions, nb_visits_converted, bounce_count, sum_visit_length, bounce_rate, nb_actions_per_visit, avg_time_on_site (default: nb_visits)"
+                    },
+                    "granularity": {
+                        "type": "string",
+                        "description": "Period of the rows when grouping by period, and unit of lastN dates",
+                        "enum": ["day", "week", "month", "year"],
+                        "default": "month"
+                    },
+                    "date": {
+                        "type": "string",
+                        "description": "Date, date range or lastN (e.g., 'last24', '2023-01-01,2024-12-31', 'today')",
+                        "default": "last12"
+                    },
+                    "group_by": {
+                        "type": "string",
+                        "description": "'period' for totals of all sites per period, 'site' or 'label' for a ranking",
+                        "enum": ["period", "site", "label"],
+                        "default": "period"
+                    },
+                    "site_ids": {
+                        "type": "array",
+                        "items": {"type": "integer"},
+                        "description": "Restrict to these sites (default: all)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of rows of a ranking",
+                        "default": 10
+                    },
+                    **OUTPUT_PROPERTIES,
+                    **TIMEOUT_PROPERTIES
+                },
+                "required": []
+            }
+        ),
+        Tool(
+            name="get_job_status",
+            description="Get the status of a long-running request that was handed back as a background job",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "job_id": {
+                        "type": "string",
+                        "description": "The job ID returned by a previous tool call"
+                    }
+                },
+                "required": ["job_id"]
+            }
+        ),
+        Tool(
+            name="get_job_result",
+            description="Get the result of a background job, or its status if it is still running",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "job_id": {
+                        "type": "string",
+                        "description": "The job ID returned by a previous tool call"
+                    },
+                    "wait": {
+                        "type": "number",
+                        "description": "Seconds to wait for the job to finish before returning its status",
+                        "default": 0
+                    },
+                    **OUTPUT_PROPERTIES
+                },
+                "required": ["job_id"]
+            }
+        ),
+        Tool(
+            name="get_server_stats",
+            description="Get runtime statistics of the MCP server: response cache hits and revalidations, and bytes transferred from Matomo per content encoding",
+            inputSchema={
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        ),
+        Tool(
+            name="get_segment_stats",
+            description="Get usage and cache hit statistics for the segments used in queries, and which segments were pre-registered for archiving",
+            inputSchema={
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
         )
     ]
 
 
+async def run_tool(client: MatomoClient, name: str, arguments: Any) -> Any:
+    """
+    Execute a Matomo reporting tool and return its result.
+
+    Reports are returned as models where possible, so that large cached
+    reports are summarized by :func:`format_result` without being expanded
+    into row dicts.
+    """
+    if name == "get_site_info":
+        site_id = arguments["site_id"]
+        return await client.get_site_info(site_id)
+
+    elif name == "get_visits_summary":
+        site_id = arguments["site_id"]
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+        return await client.get_visits_summary(site_id, period, date, typed=True)
+
+    elif name == "get_page_urls":
+        site_id = arguments["site_id"]
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+        limit = arguments.get("limit", 10)
+        return await client.get_page_urls(site_id, period, date, limit, typed=True)
+
+    elif name == "get_countries":
+        site_id = arguments["site_id"]
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+        limit = arguments.get("limit", 10)
+        return await client.get_countries(site_id, period, date, limit, typed=True)
+
+    elif name == "get_user_settings":
+        site_id = arguments["site_id"]
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+        return await client.get_user_settings(site_id, period, date, typed=True)
+
+    elif name == "get_browsers":
+        site_id = arguments["site_id"]
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+        return await client.get_browsers(site_id, period, date, typed=True)
+
+    elif name == "get_referrers":
+        site_id = arguments["site_id"]
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+        limit = arguments.get("limit", 10)
+        return await client.get_referrers(site_id, period, date, limit, typed=True)
+
+    elif name == "query_custom_report":
+        method = arguments["method"]
+        site_id = arguments["site_id"]
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+
+        params = {
+            "idSite": site_id,
+            "period": period,
+            "date": date
+        }
+
+        if "additional_params" in arguments:
+            additional = json.loads(arguments["additional_params"])
+            params.update(additional)
+
+        return await client.call_api(method, params, as_table=True)
+
+    elif name == "compare_periods":
+        site_id = arguments["site_id"]
+        return await client.compare_periods(
+            site_id,
+            method=arguments.get("method", "VisitsSummary.get"),
+            period=arguments.get("period", "day"),
+            date=arguments.get("date", "yesterday"),
+            segment=arguments.get("segment"),
+            metrics=arguments.get("metrics"),
+            join_rows=arguments.get("join_rows", False),
+            limit=arguments.get("limit", 10)
+        )
+
+    elif name == "browse_report":
+        site_id = arguments["site_id"]
+        method = arguments.get("method", "Actions.getPageUrls")
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+        limit = arguments.get("limit", 10)
+        return await client.get_report_level(method, site_id, period, date, limit)
+
+    elif name == "get_subtables":
+        site_id = arguments["site_id"]
+        method = arguments.get("method", "Actions.getPageUrls")
+        subtable_ids = arguments["subtable_ids"]
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+        limit = arguments.get("limit", 10)
+        return await client.get_subtables(method, site_id, subtable_ids, period, date, limit)
+
+    elif name == "get_goal_conversions":
+        site_id = arguments["site_id"]
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+        segment = arguments.get("segment")
+        ecommerce = arguments.get("ecommerce", False)
+        return await client.get_goal_conversions(site_id, period, date, segment, ecommerce)
+
+    elif name == "get_ecommerce_items":
+        site_id = arguments["site_id"]
+        period = arguments.get("period", "day")
+        date = arguments.get("date", "today")
+        dimension = arguments.get("dimension", "sku")
+        limit = arguments.get("limit", 10)
+        return await client.get_ecommerce_items(site_id, period, date, dimension, limit)
+
+    elif name == "get_live_visitors":
+        site_id = arguments["site_id"]
+        minutes = arguments.get("minutes", 30)
+        limit = arguments.get("limit", 10)
+        tracker = get_live_tracker()
+        await tracker.poll(site_id)
+        return tracker.summary(site_id, minutes, limit)
+
+    elif name == "sync_rollup":
+        return await get_rollup().sync()
+
+    elif name == "query_rollup":
+        return await get_rollup().query(
+            report=arguments.get("report", "visits"),
+            metrics=arguments.get("metrics"),
+            granularity=arguments.get("granularity", "month"),
+            date=arguments.get("date", "last12"),
+            group_by=arguments.get("group_by", "period"),
+            site_ids=arguments.get("site_ids"),
+            limit=arguments.get("limit", 10)
+        )
+
+    else:
+        raise ValueError(f"Unknown tool: {name}")
+
+
+def job_handle(job: Job) -> dict:
+    """Describe a job handed back instead of a result."""
+    info = job.to_dict()
+    info["message"] = (
+        f"The request is taking longer than {job_manager.threshold:g}s and continues "
+        "in the background. Use get_job_status or get_job_result with this job_id."
+    )
+    return info
+
+
 @app.call_tool()
 async def call_tool(name: str, arguments: Any) -> list[TextContent]:
     """Handle tool calls for Matomo reporting."""
     try:
-        client = get_client()
-
-        if name == "get_site_info":
-            site_id = arguments["site_id"]
-            result = await client.get_site_info(site_id)
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-
-        elif name == "get_visits_summary":
-            site_id = arguments["site_id"]
-            period = arguments.get("period", "day")
-            date = arguments.get("date", "today")
-            result = await client.get_visits_summary(site_id, period, date)
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-
-        elif name == "get_page_urls":
-            site_id = arguments["site_id"]
-            period = arguments.get("period", "day")
-            date = arguments.get("date", "today")
-            limit = arguments.get("limit", 10)
-            result = await client.get_page_urls(site_id, period, date, limit)
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-
-        elif name == "get_countries":
-            site_id = arguments["site_id"]
-            period = arguments.get("period", "day")
-            date = arguments.get("date", "today")
-            limit = arguments.get("limit", 10)
-            result = await client.get_countries(site_id, period, date, limit)
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-
-        elif name == "get_user_settings":
-            site_id = arguments["site_id"]
-            period = arguments.get("period", "day")
-            date = arguments.get("date", "today")
-            result = await client.get_user_settings(site_id, period, date)
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-
-        elif name == "get_browsers":
-            site_id = arguments["site_id"]
-            period = arguments.get("period", "day")
-            date = arguments.get("date", "today")
-            result = await client.get_browsers(site_id, period, date)
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-
-        elif name == "get_referrers":
-            site_id = arguments["site_id"]
-            period = arguments.get("period", "day")
-            date = arguments.get("date", "today")
-            limit = arguments.get("limit", 10)
-            result = await client.get_referrers(site_id, period, date, limit)
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
-
-        elif name == "query_custom_report":
-            method = arguments["method"]
-            site_id = arguments["site_id"]
-            period = arguments.get("period", "day")
-            date = arguments.get("date", "today")
-
-            params = {
-                "idSite": site_id,
-                "period": period,
-                "date": date
+        arguments = arguments or {}
+        # Output options only shape the response, so they are not part of the request
+        output = {k: arguments[k] for k in OUTPUT_ARGUMENTS if k in arguments}
+        report_arguments = {k: v for k, v in arguments.items() if k not in OUTPUT_ARGUMENTS}
+
+        if name == "get_job_status":
+            result = job_manager.get(arguments["job_id"]).to_dict()
+
+        elif name == "get_job_result":
+            wait = min(float(arguments.get("wait", 0)), job_manager.threshold)
+            job = await job_manager.wait(arguments["job_id"], wait)
+            if job.status in ("done", "error"):
+                # Raises the job's exception if it failed
+                result = job.task.result()
+            else:
+                result = job.to_dict()
+
+        elif name == "get_server_stats":
+            client = get_client()
+            result = {
+                "cache": client.cache.stats() if client.cache is not None else None,
+                "transfer": client.transfer.to_dict(),
+                "jobs": job_manager.stats(),
+                "memory": memory_budget.stats(),
             }
 
-            if "additional_params" in arguments:
-                additional = json.loads(arguments["additional_params"])
-                params.update(additional)
-
-            result = await client.call_api(method, params)
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
+        elif name == "get_segment_stats":
+            client = get_client()
+            result = {
+                "cache": client.cache.stats() if client.cache is not None else None,
+                "segments": client.segments.stats() if client.segments is not None else [],
+            }
 
         else:
-            raise ValueError(f"Unknown tool: {name}")
+            client = get_client()
+            # The deadline is part of the key: a job only serves calls with the same deadline
+            timeout_ms = report_arguments.get("timeout_ms")
+            timeout = timeout_ms / 1000 if timeout_ms else None
+            started = time.monotonic()
+            # Backpressure: new calls wait while the server is over its memory budget,
+            # but not beyond their deadline, which also covers the wait
+            try:
+                await memory_budget.admit(timeout)
+            except TimeoutError:
+                raise TimeoutError(f"{name} did not finish within {timeout_ms:g} ms") from None
+            if timeout is not None:
+                timeout = max(timeout - (time.monotonic() - started), 0.001)
+            running, result = await job_manager.run(
+                make_request_key(name, report_arguments),
+                name,
+                lambda: memory_budget.track(run_tool(client, name, report_arguments)),
+                timeout=timeout
+            )
+            if running is not None:
+                result = job_handle(running)
+
+        return [TextContent(
+            type="text",
+            text=format_result(
+                result,
+                max_bytes=output.get("max_output_bytes", MAX_OUTPUT_BYTES),
+                max_rows=output.get("max_rows", MAX_ROWS),
+                sort_by=output.get("sort_by"),
+                cursor=output.get("cursor")
+            )
+        )]
 
     except Exception as e:
         logger.error(f"Error executing tool {name}: {str(e)}")
@@ -0,0 +1,226 @@
+import asyncio
+import base64
+import json
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+import httpx
+
+from .cache import make_cache_key
+from .memory import MemoryLimitExceeded
+
+# Headers describing the encoded body, which cassettes store decoded
+_ENCODING_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+
+class Transport:
+    """Sends HTTP GET requests to Matomo on behalf of :class:`MatomoClient`."""
+
+    async def get(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        headers: Dict[str, str],
+        timeout: float
+    ) -> httpx.Response:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        """Release resources held by the transport."""
+
+
+class HttpxTransport(Transport):
+    """
+    Transport sending requests over a shared, pooled httpx client.
+
+    With ``max_response_bytes``, responses are streamed and rejected as soon
+    as their announced or received size exceeds the limit, before the whole
+    body is held in memory. Compressed bodies are also checked after decoding.
+    """
+
+    def __init__(self, limits: Optional[httpx.Limits] = None, max_response_bytes: int = 0):
+        self.limits = limits or httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        self.max_response_bytes = max_response_bytes
+        self.rejected = 0
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def get(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        headers: Dict[str, str],
+        timeout: float
+    ) -> httpx.Response:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=self.limits)
+        if not self.max_response_bytes:
+            return await self._client.get(url, params=params, headers=headers, timeout=timeout)
+
+        request = self._client.build_request(
+            'GET', url, params=params, headers=headers, timeout=timeout
+        )
+        response = await self._client.send(request, stream=True)
+        try:
+            announced = response.headers.get('content-length')
+            if announced is not None and int(announced) > self.max_response_bytes:
+                self._reject(announced)
+            chunks = []
+            received = 0
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+                if received > self.max_response_bytes:
+                    self._reject(f"more than {received}")
+                chunks.append(chunk)
+        finally:
+            await response.aclose()
+
+        # Rebuild the response from the raw body so it is decoded as usual
+        buffered = httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=httpx.ByteStream(b''.join(chunks)),
+            request=request,
+        )
+        await buffered.aread()
+        if len(buffered.content) > self.max_response_bytes:
+            self._reject(str(len(buffered.content)))
+        return buffered
+
+    def _reject(self, size: str) -> None:
+        self.rejected += 1
+        raise MemoryLimitExceeded(
+            f"Matomo response of {size} bytes exceeds the limit of {self.max_response_bytes} "
+            "bytes; narrow the date range, add a limit or use a segment"
+        )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _request_key(params: Dict[str, Any]) -> str:
+    params = dict(params)
+    return make_cache_key(str(params.pop('method', '')), params)
+
+
+class RecordingTransport(Transport):
+    """
+    Transport recording every exchange of another transport to a cassette.
+
+    The cassette is a JSON Lines file with one request/response pair per
+    line, including the time the response took. The API token is never
+    written to it.
+    """
+
+    def __init__(self, inner: Transport, path: str):
+        """
+        Initialize the recorder.
+
+        Args:
+            inner: Transport performing the actual requests
+            path: Cassette file, appended to if it exists
+        """
+        self.inner = inner
+        self.path = path
+
+    async def get(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        headers: Dict[str, str],
+        timeout: float
+    ) -> httpx.Response:
+        started = time.monotonic()
+        response = await self.inner.get(url, params, headers, timeout)
+        elapsed = time.monotonic() - started
+
+        interaction = {
+            'request': {k: str(v) for k, v in params.items() if k != 'token_auth'},
+            'response': {
+                'status_code': response.status_code,
+                'headers': {
+                    k: v for k, v in response.headers.items()
+                    if k.lower() not in _ENCODING_HEADERS
+                },
+                'body': base64.b64encode(response.content).decode('ascii'),
+                'wire_bytes': response.num_bytes_downloaded,
+            },
+            'elapsed': round(elapsed, 6),
+        }
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(interaction) + '\n')
+        return response
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class ReplayTransport(Transport):
+    """
+    Transport answering requests from a recorded cassette.
+
+    Requests are matched on their parameters (ignoring order and the token).
+    Repeated requests receive the recorded responses in order, the last one
+    being reused once they are exhausted. Each response is delayed by its
+    recorded duration divided by ``speed``.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        """
+        Initialize the replayer.
+
+        Args:
+            path: Cassette file written by :class:`RecordingTransport`
+            speed: Timing factor; 1.0 replays original timing, 10.0 ten
+                times faster, 0 without any delay
+        """
+        self.path = path
+        self.speed = speed
+        self.requests = 0
+        self._responses: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._last: Dict[str, Dict[str, Any]] = {}
+
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    self._responses[_request_key(interaction['request'])].append(interaction)
+
+    async def get(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        headers: Dict[str, str],
+        timeout: float
+    ) -> httpx.Response:
+        key = _request_key(params)
+        queue = self._responses.get(key)
+        if queue:
+            interaction = self._last[key] = queue.popleft()
+        elif key in self._last:
+            interaction = self._last[key]
+        else:
+            raise LookupError(f"No recorded response for {key}")
+
+        self.requests += 1
+        delay = interaction['elapsed'] / self.speed if self.speed > 0 else 0
+        if delay > timeout:
+            await asyncio.sleep(timeout)
+            raise httpx.ReadTimeout(f"Replayed response exceeded timeout of {timeout}s")
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        recorded = interaction['response']
+        return httpx.Response(
+            recorded['status_code'],
+            headers=recorded['headers'],
+            content=base64.b64decode(recorded['body']),
+            request=httpx.Request('GET', url, params=params),
+        )
+
+    def unused(self) -> List[str]:
+        """Return the keys of recorded requests that were never replayed."""
+        return [key for key, queue in self._responses.items() if queue and key not in self._last]
+
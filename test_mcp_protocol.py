@@ -55,22 +55,23 @@ async def test_mcp_protocol():
             print(f"      Optional: {', '.join(info['optional_params'])}")
 
     print("\n4. Testing tool schemas...")
+    output_options = ["max_output_bytes", "max_rows", "sort_by", "cursor", "timeout_ms"]
     schema_tests = {
         "get_site_info": {
             "required": ["site_id"],
-            "optional": []
+            "optional": ["timeout_ms"]
         },
         "get_visits_summary": {
             "required": ["site_id"],
-            "optional": ["period", "date"]
+            "optional": ["period", "date", *output_options]
         },
         "get_page_urls": {
             "required": ["site_id"],
-            "optional": ["period", "date", "limit"]
+            "optional": ["period", "date", "limit", *output_options]
         },
         "query_custom_report": {
             "required": ["method", "site_id"],
-            "optional": ["period", "date", "additional_params"]
+            "optional": ["period", "date", "additional_params", *output_options]
         }
     }
 
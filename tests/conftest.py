@@ -0,0 +1,49 @@
+import httpx
+import pytest
+
+from matomo_mcp.cache import ResponseCache
+from matomo_mcp.client import MatomoClient
+from matomo_mcp.transport import Transport
+
+
+class StaticTransport(Transport):
+    """Transport answering every request with the same report."""
+
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    async def get(self, url, params, headers, timeout):
+        self.calls += 1
+        return httpx.Response(200, json=self.data, request=httpx.Request("GET", url))
+
+
+@pytest.fixture
+def make_response():
+    """Build real httpx responses for patched HTTP calls."""
+    def factory(data=None, status_code=200, headers=None):
+        return httpx.Response(
+            status_code,
+            json=data,
+            headers=headers,
+            request=httpx.Request("GET", "https://matomo.example.com/index.php")
+        )
+    return factory
+
+
+@pytest.fixture
+def make_static_transport():
+    """Build transports answering every request with the given report."""
+    return StaticTransport
+
+
+@pytest.fixture
+def matomo_client():
+    """Create a Matomo client for testing."""
+    return MatomoClient("https://matomo.example.com", "test_token_123")
+
+
+@pytest.fixture
+def cached_matomo_client():
+    """Create a Matomo client with a response cache."""
+    return MatomoClient("https://matomo.example.com", "test_token_123", cache=ResponseCache())
@@ -0,0 +1,29 @@
+from matomo_mcp.cache import ResponseCache, make_cache_key
+
+
+def test_cache_key_ignores_order_and_credentials():
+    """Test that the key does not depend on parameter order or the token."""
+    a = make_cache_key("VisitsSummary.get", {"idSite": 1, "date": "today", "token_auth": "a"})
+    b = make_cache_key("VisitsSummary.get", {"date": "today", "idSite": "1", "token_auth": "b"})
+    assert a == b
+
+
+def test_cache_expires_entries():
+    """Test that entries older than the TTL are treated as misses."""
+    cache = ResponseCache(ttl=0.0)
+    cache.set("key", {"nb_visits": 1})
+    assert cache.get("key") == (False, None)
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    """Test that the least recently used entry is evicted when full."""
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.get("c") == (True, 3)
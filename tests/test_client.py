@@ -1,16 +1,12 @@
-from unittest.mock import AsyncMock, patch
+import asyncio
+from unittest.mock import patch
 
 import pytest
 
+from matomo_mcp.cache import ResponseCache
 from matomo_mcp.client import MatomoClient
 
 
-@pytest.fixture
-def matomo_client():
-    """Create a Matomo client for testing."""
-    return MatomoClient("https://matomo.example.com", "test_token_123")
-
-
 @pytest.mark.asyncio
 async def test_client_initialization(matomo_client):
     """Test that the client initializes correctly."""
@@ -20,7 +16,7 @@ async def test_client_initialization(matomo_client):
 
 
 @pytest.mark.asyncio
-async def test_get_site_info(matomo_client):
+async def test_get_site_info(matomo_client, make_response):
     """Test getting site information."""
     mock_response = {
         "idsite": "1",
@@ -30,17 +26,14 @@ async def test_get_site_info(matomo_client):
     }
 
     with patch("httpx.AsyncClient.get") as mock_get:
-        mock_get.return_value = AsyncMock(
-            json=lambda: mock_response,
-            raise_for_status=lambda: None
-        )
+        mock_get.return_value = make_response(mock_response)
 
         result = await matomo_client.get_site_info(1)
         assert result == mock_response
 
 
 @pytest.mark.asyncio
-async def test_get_visits_summary(matomo_client):
+async def test_get_visits_summary(matomo_client, make_response):
     """Test getting visits summary."""
     mock_response = {
         "nb_visits": 100,
@@ -50,17 +43,14 @@ async def test_get_visits_summary(matomo_client):
     }
 
     with patch("httpx.AsyncClient.get") as mock_get:
-        mock_get.return_value = AsyncMock(
-            json=lambda: mock_response,
-            raise_for_status=lambda: None
-        )
+        mock_get.return_value = make_response(mock_response)
 
         result = await matomo_client.get_visits_summary(1, "day", "today")
         assert result == mock_response
 
 
 @pytest.mark.asyncio
-async def test_api_error_handling(matomo_client):
+async def test_api_error_handling(matomo_client, make_response):
     """Test that API errors are handled correctly."""
     error_response = {
         "result": "error",
@@ -68,10 +58,94 @@ async def test_api_error_handling(matomo_client):
     }
 
     with patch("httpx.AsyncClient.get") as mock_get:
-        mock_get.return_value = AsyncMock(
-            json=lambda: error_response,
-            raise_for_status=lambda: None
-        )
+        mock_get.return_value = make_response(error_response)
 
         with pytest.raises(Exception, match="Matomo API error"):
             await matomo_client.call_api("SitesManager.getSiteFromId", {"idSite": 1})
+
+
+@pytest.mark.asyncio
+async def test_negotiates_compression(matomo_client, make_response):
+    """Test that supported encodings are requested explicitly."""
+    with patch("httpx.AsyncClient.get") as mock_get:
+        mock_get.return_value = make_response({"nb_visits": 1})
+
+        await matomo_client.get_visits_summary(1)
+
+        headers = mock_get.call_args.kwargs["headers"]
+        assert "gzip" in headers["Accept-Encoding"]
+        assert matomo_client.transfer.responses == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_entry_is_revalidated(make_response):
+    """Test that an expired cache entry with an ETag is revalidated with a 304."""
+    client = MatomoClient(
+        "https://matomo.example.com",
+        "test_token_123",
+        cache=ResponseCache(ttl=0.0)
+    )
+
+    with patch("httpx.AsyncClient.get") as mock_get:
+        mock_get.return_value = make_response({"nb_visits": 7}, headers={"ETag": '"v1"'})
+        first = await client.get_visits_summary(1, "month", "2024-01-01")
+
+        mock_get.return_value = make_response(status_code=304)
+        second = await client.get_visits_summary(1, "month", "2024-01-01")
+
+        assert first == second == {"nb_visits": 7}
+        assert mock_get.call_args.kwargs["headers"]["If-None-Match"] == '"v1"'
+        assert client.cache.revalidations == 1
+        assert client.transfer.not_modified == 1
+
+
+@pytest.mark.asyncio
+async def test_revalidated_entry_evicted_in_flight(make_response):
+    """Test that a 304 for an entry evicted meanwhile is answered by a full request."""
+    client = MatomoClient(
+        "https://matomo.example.com",
+        "test_token_123",
+        cache=ResponseCache(ttl=0.0, max_entries=1)
+    )
+    conditional = asyncio.Event()
+    release = asyncio.Event()
+
+    async def fake_get(url, params, headers, timeout):
+        if "If-None-Match" in headers:
+            conditional.set()
+            await release.wait()
+            return make_response(status_code=304)
+        site = params["idSite"]
+        return make_response({"nb_visits": site}, headers={"ETag": f'"v{site}"'})
+
+    with patch("httpx.AsyncClient.get", side_effect=fake_get) as mock_get:
+        await client.get_visits_summary(1, "month", "2024-01-01")
+        call = asyncio.ensure_future(client.get_visits_summary(1, "month", "2024-01-01"))
+        await conditional.wait()
+        # Evicts the entry of site 1 while its revalidation is in flight
+        await client.get_visits_summary(2, "month", "2024-01-01")
+        release.set()
+
+        assert await call == {"nb_visits": 1}
+        assert "If-None-Match" not in mock_get.call_args.kwargs["headers"]
+        assert client.cache.revalidations == 0
+
+
+@pytest.mark.asyncio
+async def test_cancellation_aborts_request(matomo_client):
+    """Test that cancelling a call aborts the in-flight request and counts it."""
+    started = asyncio.Event()
+
+    async def slow_get(*args, **kwargs):
+        started.set()
+        await asyncio.sleep(10)
+
+    with patch("httpx.AsyncClient.get", side_effect=slow_get):
+        call = asyncio.ensure_future(matomo_client.get_visits_summary(1))
+        await started.wait()
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    assert matomo_client.transfer.aborted == 1
+    assert matomo_client.transfer.responses == 0
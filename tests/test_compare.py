@@ -0,0 +1,135 @@
+import asyncio
+from datetime import date, datetime, timezone
+
+import pytest
+
+from matomo_mcp.client import MatomoClient
+from matomo_mcp.compare import compare_reports, comparison_windows, site_today
+
+TODAY = date(2024, 3, 15)  # a Friday
+
+
+@pytest.mark.parametrize("period, value, expected", [
+    ("day", "yesterday", (("day", "2024-03-14"), ("day", "2024-03-13"))),
+    ("month", "2024-03-31", (("month", "2024-03-31"), ("month", "2024-02-29"))),
+    ("week", "today", (("week", "2024-03-15"), ("week", "2024-03-08"))),
+    ("range", "2024-03-01,2024-03-10",
+     (("range", "2024-03-01,2024-03-10"), ("range", "2024-02-20,2024-02-29"))),
+    ("day", "last7", (("range", "2024-03-09,2024-03-15"), ("range", "2024-03-02,2024-03-08"))),
+    ("week", "previous2",
+     (("range", "2024-02-26,2024-03-10"), ("range", "2024-02-12,2024-02-25"))),
+    ("week", "last2",
+     (("range", "2024-03-04,2024-03-15"), ("range", "2024-02-21,2024-03-03"))),
+    ("month", "last3",
+     (("range", "2024-01-01,2024-03-15"), ("range", "2023-10-18,2023-12-31"))),
+    ("month", "previous3",
+     (("range", "2023-12-01,2024-02-29"), ("range", "2023-09-01,2023-11-30"))),
+    ("year", "last1",
+     (("range", "2024-01-01,2024-03-15"), ("range", "2023-10-18,2023-12-31"))),
+])
+def test_comparison_windows(period, value, expected):
+    """Test that the previous window directly precedes the current one."""
+    assert comparison_windows(period, value, TODAY) == expected
+
+
+def test_comparison_windows_rejects_unsupported_dates():
+    """Test that dates which cannot be shifted are rejected."""
+    with pytest.raises(ValueError):
+        comparison_windows("range", "today", TODAY)
+    with pytest.raises(ValueError):
+        comparison_windows("day", "lastWeek", TODAY)
+
+
+def test_site_today_honors_timezone():
+    """Test that the current date is taken in the site timezone."""
+    now = datetime(2024, 3, 15, 23, 30, tzinfo=timezone.utc)
+    assert site_today("UTC", now) == date(2024, 3, 15)
+    assert site_today("UTC+2", now) == date(2024, 3, 16)
+    assert site_today("America/New_York", now) == date(2024, 3, 15)
+
+
+def test_compare_reports_joins_rows():
+    """Test totals and row-level deltas of flat reports."""
+    current = [{"label": "Germany", "nb_visits": 150}, {"label": "France", "nb_visits": 50}]
+    previous = [{"label": "Germany", "nb_visits": 100}]
+
+    result = compare_reports(current, previous, join_rows=True)
+
+    assert result["metrics"]["nb_visits"] == {
+        "current": 200, "previous": 100, "change": 100, "change_percent": 100.0
+    }
+    assert result["joined_rows"][1] == {
+        "label": "France",
+        "metrics": {"nb_visits": {
+            "current": 50, "previous": None, "change": None, "change_percent": None
+        }},
+    }
+
+
+@pytest.mark.asyncio
+async def test_compare_periods_fetches_windows_concurrently():
+    """Test that both windows are requested at the same time."""
+    client = MatomoClient("https://matomo.example.com", "test_token_123")
+    in_flight = 0
+    peak = 0
+
+    async def fake_call_api(method, params=None, use_cache=True):
+        nonlocal in_flight, peak
+        if method == "SitesManager.getSiteFromId":
+            return {"timezone": "UTC"}
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"nb_visits": 120 if params["date"] == "2024-03-14" else 100, "bounce_rate": "40%"}
+
+    client.call_api = fake_call_api
+    result = await client.compare_periods(1, date="2024-03-14")
+
+    assert peak == 2
+    assert result["previous"] == {"period": "day", "date": "2024-03-13"}
+    assert result["metrics"]["nb_visits"]["change_percent"] == 20.0
+    assert result["metrics"]["bounce_rate"]["change"] == 0
+
+
+@pytest.mark.asyncio
+async def test_compare_periods_uses_matomo_totals_for_flat_reports():
+    """Test that flat reports are compared on Matomo's totals without downloading all rows."""
+    client = MatomoClient("https://matomo.example.com", "test_token_123")
+    calls = []
+
+    async def fake_call_api(method, params=None, use_cache=True):
+        calls.append((method, params))
+        if method == "SitesManager.getSiteFromId":
+            return {"timezone": "UTC"}
+        current = params["date"] == "2024-03-14"
+        if method == "API.getProcessedReport":
+            rows = [{"label": "Germany", "nb_visits": 150}, {"label": "France", "nb_visits": 50}]
+            return {
+                "reportData": rows[:params["filter_limit"]],
+                "reportTotal": {"nb_visits": 300 if current else 200, "bounce_rate": 90},
+            }
+        assert params["label[]"] == ["Germany"]
+        return [{"label": "Germany", "nb_visits": 100}]
+
+    client.call_api = fake_call_api
+    result = await client.compare_periods(1, method="UserCountry.getCountry", date="2024-03-14")
+
+    assert result["metrics"] == {
+        "nb_visits": {"current": 300, "previous": 200, "change": 100, "change_percent": 50.0}
+    }
+    processed = [params for method, params in calls if method == "API.getProcessedReport"]
+    assert [p["filter_limit"] for p in processed] == [1, 1]
+    assert all(p["apiModule"] == "UserCountry" and p["totals"] == 1 for p in processed)
+
+    calls.clear()
+    result = await client.compare_periods(
+        1, method="UserCountry.getCountry", date="2024-03-14", join_rows=True, limit=1
+    )
+    assert result["joined_rows"] == [{
+        "label": "Germany",
+        "metrics": {"nb_visits": {
+            "current": 150, "previous": 100, "change": 50, "change_percent": 50.0
+        }},
+    }]
+    assert [m for m, _ in calls][-1] == "UserCountry.getCountry"
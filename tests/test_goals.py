@@ -0,0 +1,86 @@
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+import pytest
+
+GOALS = [
+    {"idgoal": "1", "name": "Newsletter", "match_attribute": "url", "pattern": "/thanks"},
+    {"idgoal": "2", "name": "Contact", "match_attribute": "event_action", "pattern": "submit"},
+]
+
+
+@pytest.mark.asyncio
+async def test_goal_conversions_use_one_bulk_request(matomo_client, make_response):
+    """Test that all goal metrics are fetched in one bulk request and joined."""
+    bulk = [
+        {"nb_conversions": 30, "conversion_rate": 3.0, "revenue": 0, "nb_visits": 999},
+        {"nb_conversions": 20, "conversion_rate": 2.0, "revenue": 0},
+        {"nb_conversions": 10, "conversion_rate": 1.0, "revenue": 0},
+    ]
+
+    with patch("httpx.AsyncClient.get") as mock_get:
+        mock_get.side_effect = [make_response(GOALS), make_response(bulk)]
+
+        rows = await matomo_client.get_goal_conversions(1, "month", "2024-01-01")
+
+        assert mock_get.call_count == 2
+        params = mock_get.call_args.kwargs["params"]
+        assert params["method"] == "API.getBulkRequest"
+        assert parse_qs(params["urls[2]"]) == {
+            "method": ["Goals.get"], "idSite": ["1"], "period": ["month"],
+            "date": ["2024-01-01"], "idGoal": ["2"],
+        }
+
+    assert [row["name"] for row in rows] == ["All goals", "Newsletter", "Contact"]
+    assert rows[1]["nb_conversions"] == 20
+    assert rows[1]["pattern"] == "/thanks"
+    assert "nb_visits" not in rows[0]
+
+
+@pytest.mark.asyncio
+async def test_goal_definitions_are_cached(matomo_client, make_response):
+    """Test that goal definitions are fetched only once."""
+    with patch("httpx.AsyncClient.get") as mock_get:
+        mock_get.return_value = make_response(GOALS)
+
+        await matomo_client.get_goals(1)
+        goals = await matomo_client.get_goals(1)
+
+        assert goals == GOALS
+        assert mock_get.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_goal_conversions_multiple_periods(matomo_client, make_response):
+    """Test that multi-period responses produce one row per goal and date."""
+    bulk = [
+        {"2024-01-01": {"nb_conversions": 1}, "2024-01-02": []},
+        {"2024-01-01": {"nb_conversions": 1}, "2024-01-02": []},
+        {"2024-01-01": [], "2024-01-02": []},
+        {"2024-01-01": {"nb_conversions": 2, "revenue": 99.5}, "2024-01-02": []},
+        {"2024-01-01": [], "2024-01-02": []},
+    ]
+
+    with patch("httpx.AsyncClient.get") as mock_get:
+        mock_get.side_effect = [make_response(GOALS), make_response(bulk)]
+
+        rows = await matomo_client.get_goal_conversions(1, "day", "last2", ecommerce=True)
+
+    assert len(rows) == 10
+    orders = [r for r in rows if r["idgoal"] == "ecommerceOrder"]
+    assert orders[0] == {
+        "date": "2024-01-01", "idgoal": "ecommerceOrder", "name": "E-commerce orders",
+        "nb_conversions": 2, "revenue": 99.5,
+    }
+
+
+@pytest.mark.asyncio
+async def test_bulk_request_raises_on_error(matomo_client, make_response):
+    """Test that an error in one bulk entry is reported."""
+    with patch("httpx.AsyncClient.get") as mock_get:
+        mock_get.return_value = make_response([{}, {"result": "error", "message": "No access"}])
+
+        with pytest.raises(Exception, match="No access"):
+            await matomo_client.bulk_request([
+                ("Goals.get", {"idSite": 1}), ("Goals.get", {"idSite": 2})
+            ])
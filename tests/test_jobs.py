@@ -0,0 +1,226 @@
+import asyncio
+
+import pytest
+
+from matomo_mcp.cache import ResponseCache
+from matomo_mcp.jobs import JobManager, make_request_key
+from matomo_mcp.memory import MemoryBudget, estimate_size
+from matomo_mcp.models import ActionTable
+
+
+@pytest.mark.asyncio
+async def test_fast_request_returns_result():
+    """Test that a request finishing within the threshold returns directly."""
+    manager = JobManager(threshold=1.0)
+
+    async def work():
+        return {"nb_visits": 10}
+
+    job, result = await manager.run("key", "get_visits_summary", work)
+    assert job is None
+    assert result == {"nb_visits": 10}
+
+
+@pytest.mark.asyncio
+async def test_slow_request_becomes_job():
+    """Test that a slow request is handed back as a job and completes later."""
+    manager = JobManager(threshold=0.01)
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return [1, 2, 3]
+
+    job, result = await manager.run("key", "query_custom_report", work)
+    assert result is None
+    assert job.status == "running"
+
+    release.set()
+    job = await manager.wait(job.job_id, 1.0)
+    assert job.status == "done"
+    assert job.task.result() == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_requests_are_deduplicated_by_key():
+    """Test that identical requests attach to the same running job."""
+    manager = JobManager(threshold=0.01)
+    release = asyncio.Event()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "ok"
+
+    key = make_request_key("query_custom_report", {"site_id": 1, "method": "Goals.get"})
+    first, _ = await manager.run(key, "query_custom_report", work)
+    second, _ = await manager.run(key, "query_custom_report", work)
+
+    assert first is second
+    assert calls == 1
+    release.set()
+    await manager.wait(first.job_id, 1.0)
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_are_not_reused():
+    """Test that a request made after its job finished runs again."""
+    manager = JobManager(threshold=0.01)
+    release = asyncio.Event()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return calls
+
+    job, _ = await manager.run("key", "get_live_visitors", work)
+    release.set()
+    await manager.wait(job.job_id, 1.0)
+    await asyncio.sleep(0)
+
+    assert await manager.run("key", "get_live_visitors", work) == (None, 2)
+    assert await manager.run("key", "get_live_visitors", work) == (None, 3)
+    # The detached job is still available by ID
+    assert manager.get(job.job_id).task.result() == 1
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_expire():
+    """Test that finished jobs are dropped after the retention period."""
+    manager = JobManager(threshold=0.01, retention=0.0)
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "ok"
+
+    job, _ = await manager.run("key", "get_referrers", work)
+    release.set()
+    await manager.wait(job.job_id, 1.0)
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(ValueError, match="Unknown or expired job"):
+        manager.get(job.job_id)
+
+
+def test_request_key_ignores_argument_order():
+    """Test that the request key does not depend on argument order."""
+    assert make_request_key("t", {"a": 1, "b": 2}) == make_request_key("t", {"b": 2, "a": 1})
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_cancels_unshared_work():
+    """Test that work nobody waits for anymore is cancelled."""
+    manager = JobManager(threshold=10.0)
+    started = asyncio.Event()
+
+    async def work():
+        started.set()
+        await asyncio.sleep(10)
+
+    caller = asyncio.ensure_future(manager.run("key", "get_visits_summary", work))
+    await started.wait()
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    await asyncio.sleep(0)
+
+    stats = manager.stats()
+    assert stats["cancelled"] == 1
+    assert stats["abandoned_waiters"] == 1
+    assert stats["jobs"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_detaches_from_shared_work():
+    """Test that work keeps running while another caller still waits for it."""
+    manager = JobManager(threshold=10.0)
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "ok"
+
+    first = asyncio.ensure_future(manager.run("key", "get_visits_summary", work))
+    second = asyncio.ensure_future(manager.run("key", "get_visits_summary", work))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    await asyncio.sleep(0.01)
+    release.set()
+
+    assert await second == (None, "ok")
+    assert manager.stats()["cancelled"] == 0
+    assert manager.stats()["abandoned_waiters"] == 1
+
+
+@pytest.mark.asyncio
+async def test_timeout_cancels_work():
+    """Test that a deadline cancels the work and raises TimeoutError."""
+    manager = JobManager(threshold=10.0)
+    cancelled = False
+
+    async def work():
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    with pytest.raises(TimeoutError, match="within 20 ms"):
+        await manager.run("key", "get_visits_summary", work, timeout=0.02)
+
+    assert cancelled
+    assert manager.stats()["timed_out"] == 1
+    assert manager.stats()["wasted_seconds"] > 0
+
+
+@pytest.mark.asyncio
+async def test_kept_results_are_charged_and_reclaimed():
+    """Test that results kept for retrieval count against the memory budget."""
+    budget = MemoryBudget(limit=1)
+    manager = JobManager(threshold=0.01, budget=budget)
+    budget.add_reclaimer(manager.shrink)
+    release = asyncio.Event()
+    result = [{"label": "/index", "nb_visits": 10}]
+
+    async def work():
+        await release.wait()
+        return result
+
+    job, _ = await manager.run("key", "get_page_urls", work)
+    release.set()
+    await manager.wait(job.job_id, 1.0)
+    await asyncio.sleep(0)
+    assert budget.usage["jobs"] == estimate_size(result)
+
+    budget.reclaim()
+    assert budget.usage["jobs"] == 0
+    with pytest.raises(ValueError, match="Unknown or expired job"):
+        manager.get(job.job_id)
+
+
+@pytest.mark.asyncio
+async def test_results_sharing_cached_tables_are_not_charged_twice():
+    """Test that a kept result is only charged for what the cache does not hold."""
+    budget = MemoryBudget()
+    cache = ResponseCache(budget=budget)
+    cache.set("key", [{"label": f"/page-{i}", "nb_visits": i} for i in range(100)])
+    _, table = cache.get("key", as_table=True)
+    manager = JobManager(threshold=0.01, budget=budget)
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return ActionTable.view(table)
+
+    job, _ = await manager.run("key", "get_page_urls", work)
+    release.set()
+    await manager.wait(job.job_id, 1.0)
+    await asyncio.sleep(0)
+
+    assert 0 < budget.usage["jobs"] < estimate_size(table) / 10
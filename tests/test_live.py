@@ -0,0 +1,86 @@
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from matomo_mcp.client import MatomoClient
+from matomo_mcp.live import LiveTracker
+
+
+def make_visit(idvisit, last_action, url, visitor="abc", country="Germany"):
+    return {
+        "idVisit": str(idvisit),
+        "visitorId": visitor,
+        "firstActionTimestamp": last_action - 30,
+        "lastActionTimestamp": last_action,
+        "country": country,
+        "deviceType": "Desktop",
+        "browserName": "Firefox",
+        "referrerType": "direct",
+        "actions": "1",
+        "actionDetails": [{"type": "action", "url": url, "timestamp": last_action}],
+    }
+
+
+@pytest.fixture
+def tracker():
+    client = MatomoClient("https://matomo.example.com", "test_token_123")
+    return LiveTracker(client, buffer_size=3, min_interval=0.0)
+
+
+@pytest.mark.asyncio
+async def test_poll_uses_cursor(tracker):
+    """Test that follow-up polls only ask for visits after the cursor."""
+    now = int(time.time())
+    tracker.client.call_api = AsyncMock(side_effect=[
+        [make_visit(2, now - 10, "/b"), make_visit(1, now - 60, "/a")],
+        [make_visit(3, now, "/c")],
+    ])
+
+    assert await tracker.poll(1) == 2
+    assert await tracker.poll(1) == 1
+
+    first_params = tracker.client.call_api.call_args_list[0].args[1]
+    assert set(first_params) == {"idSite", "minTimestamp", "filter_limit"}
+    # The first poll reaches back max_minutes, across midnight if need be
+    assert now - 3600 - 1 <= first_params["minTimestamp"] <= now - 3600
+    second_params = tracker.client.call_api.call_args_list[1].args[1]
+    assert second_params["minTimestamp"] == now - 10
+    assert "period" not in second_params and "date" not in second_params
+
+
+@pytest.mark.asyncio
+async def test_updated_visit_replaces_old_entry(tracker):
+    """Test that a visit with new actions is updated rather than duplicated."""
+    now = int(time.time())
+    tracker.client.call_api = AsyncMock(side_effect=[
+        [make_visit(1, now - 60, "/a")],
+        [make_visit(1, now, "/b")],
+    ])
+
+    await tracker.poll(1)
+    await tracker.poll(1)
+
+    summary = tracker.summary(1, minutes=5)
+    assert summary["visits"] == 1
+    assert summary["top_pages"] == [{"label": "/b", "count": 1}]
+
+
+@pytest.mark.asyncio
+async def test_summary_window_and_bounded_buffer(tracker):
+    """Test that the summary honors the window and the buffer stays bounded."""
+    now = int(time.time())
+    tracker.client.call_api = AsyncMock(return_value=[
+        make_visit(4, now, "/d", visitor="x"),
+        make_visit(3, now - 30, "/c", visitor="y"),
+        make_visit(2, now - 45, "/c", visitor="y"),
+        make_visit(1, now - 1800, "/a"),
+    ])
+
+    await tracker.poll(1)
+    summary = tracker.summary(1, minutes=1)
+
+    assert summary["visits"] == 3
+    assert summary["visitors"] == 2
+    assert summary["top_pages"][0] == {"label": "/c", "count": 2}
+    assert summary["truncated"] is True
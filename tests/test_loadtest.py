@@ -0,0 +1,68 @@
+import json
+import sys
+
+import pytest
+
+import matomo_mcp.server as server
+from matomo_mcp.client import MatomoClient
+from matomo_mcp.loadtest import LoadTest, is_error, load_mix, percentile
+from matomo_mcp.transport import RecordingTransport
+
+
+def test_percentile_nearest_rank():
+    """Test percentile calculation."""
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 50) is None
+
+
+def test_load_mix_fills_site_id(tmp_path):
+    """Test that the mix placeholders are replaced and weights default to 1."""
+    path = tmp_path / "mix.json"
+    path.write_text(json.dumps([{"name": "get_site_info", "arguments": {"site_id": "{site_id}"}}]))
+
+    assert load_mix(str(path), 7) == [
+        {"name": "get_site_info", "arguments": {"site_id": 7}, "weight": 1.0}
+    ]
+
+
+def test_is_error():
+    """Test detection of failed tool calls."""
+    assert is_error({"error": {"code": -32600}})
+    assert is_error({"result": {"content": [{"type": "text", "text": "Error: boom"}]}})
+    assert not is_error({"result": {"content": [{"type": "text", "text": "{}"}]}})
+
+
+@pytest.mark.asyncio
+async def test_load_test_against_replayed_server(tmp_path, monkeypatch, make_static_transport):
+    """Test a short load run against a server replaying a cassette."""
+    cassette = tmp_path / "cassette.jsonl"
+    client = MatomoClient(
+        "https://matomo.example.com",
+        "token",
+        transport=RecordingTransport(
+            make_static_transport([{"label": "x", "nb_visits": 1}]), str(cassette)
+        )
+    )
+    mix = load_mix(None, 1)
+    for entry in mix:
+        await server.run_tool(client, entry["name"], entry["arguments"])
+
+    monkeypatch.setenv("MATOMO_REPLAY", str(cassette))
+    monkeypatch.setenv("MATOMO_REPLAY_SPEED", "0")
+
+    test = LoadTest(
+        [sys.executable, "-m", "matomo_mcp"],
+        mix,
+        concurrency=4,
+        duration=1.0,
+        sample_interval=0.5,
+        seed=1
+    )
+    report = await test.run()
+
+    assert report["requests"] > 0
+    assert report["errors"] == 0
+    assert report["latency"]["p50_ms"] is not None
+    assert set(report["per_tool"]) <= {entry["name"] for entry in mix}
@@ -0,0 +1,167 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+import pytest
+
+from matomo_mcp.cache import ResponseCache
+from matomo_mcp.memory import MemoryBudget, MemoryLimitExceeded, estimate_size
+from matomo_mcp.models import ReportTable
+from matomo_mcp.transport import HttpxTransport
+
+ROWS = [
+    {"label": f"/page-{i}", "nb_visits": i, "nb_hits": 2 * i, "sum_time_spent": 10 * i}
+    for i in range(200)
+]
+
+
+def test_cached_tables_are_smaller():
+    """Test that a flat report stored column-wise takes less memory than its dicts."""
+    assert estimate_size(ReportTable.from_rows(ROWS)) < 0.7 * estimate_size(ROWS)
+
+
+@pytest.mark.asyncio
+async def test_call_limit():
+    """Test that memory is charged to a call and released when it ends."""
+    budget = MemoryBudget(call_limit=1000)
+
+    async def small():
+        budget.charge("decoded", 600)
+        assert budget.total == 600
+        return "ok"
+
+    async def large():
+        budget.charge("decoded", 600)
+        budget.charge("decoded", 600)
+
+    assert await budget.track(small()) == "ok"
+    with pytest.raises(MemoryLimitExceeded):
+        await budget.track(large())
+    assert budget.total == 0
+    assert budget.peak == 1200
+
+
+@pytest.mark.asyncio
+async def test_tasks_outliving_a_call_are_not_charged():
+    """Test that a task spawned by a call does not charge it after it ended."""
+    budget = MemoryBudget()
+    release = asyncio.Event()
+
+    async def background():
+        await release.wait()
+        budget.charge("decoded", 500)
+        budget.release("responses", 100)
+
+    async def call():
+        budget.charge("responses", 100)
+        return asyncio.ensure_future(background())
+
+    task = await budget.track(call())
+    release.set()
+    await task
+
+    assert budget.total == 0
+    assert budget.usage == {"responses": 0, "decoded": 0, "cache": 0, "jobs": 0}
+
+
+@pytest.mark.asyncio
+async def test_admit_waits_for_released_memory():
+    """Test backpressure on new calls while the budget is exhausted."""
+    budget = MemoryBudget(limit=1000, wait_timeout=1.0)
+    budget.add("decoded", 1500)
+
+    admitted = asyncio.ensure_future(budget.admit())
+    await asyncio.sleep(0.01)
+    assert not admitted.done()
+
+    budget.remove("decoded", 1000)
+    await asyncio.wait_for(admitted, 1.0)
+    assert budget.waits == 1
+
+    budget.add("decoded", 1000)
+    budget.wait_timeout = 0.01
+    with pytest.raises(MemoryLimitExceeded):
+        await budget.admit()
+    assert budget.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_admit_respects_call_deadline():
+    """Test that a call with a deadline does not wait for memory beyond it."""
+    budget = MemoryBudget(limit=1000, wait_timeout=30.0)
+    budget.add("decoded", 1500)
+
+    with pytest.raises(TimeoutError, match="deadline"):
+        await asyncio.wait_for(budget.admit(timeout=0.01), 1.0)
+    assert budget.rejected == 1
+
+
+def test_cache_is_evicted_under_memory_pressure():
+    """Test that cache entries are charged to the budget and evicted to stay within it."""
+    budget = MemoryBudget(limit=2 * estimate_size(ReportTable.from_rows(ROWS)))
+    cache = ResponseCache(budget=budget)
+
+    for i in range(5):
+        cache.set(f"key-{i}", ROWS)
+
+    assert budget.usage["cache"] == cache.bytes <= budget.limit
+    assert len(cache) == 2
+    assert cache.evictions == 3
+    assert cache.get("key-4") == (True, ROWS)
+
+    cache.clear()
+    assert budget.total == 0
+
+
+def test_cache_max_bytes():
+    """Test the per-cache byte limit."""
+    cache = ResponseCache(max_bytes=1)
+    cache.set("key", ROWS)
+    assert len(cache) == 0
+    assert cache.bytes == 0
+
+
+def make_transport(handler, max_response_bytes):
+    transport = HttpxTransport(max_response_bytes=max_response_bytes)
+    transport._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return transport
+
+
+@pytest.mark.asyncio
+async def test_transport_streams_and_decodes_small_responses():
+    """Test that responses within the limit are returned decoded."""
+    body = gzip.compress(json.dumps(ROWS).encode())
+
+    def handler(request):
+        return httpx.Response(
+            200, headers={"Content-Encoding": "gzip"}, stream=httpx.ByteStream(body)
+        )
+
+    transport = make_transport(handler, 10 * 1024 * 1024)
+    response = await transport.get("https://matomo.example.com/index.php", {}, {}, 5.0)
+
+    assert response.json() == ROWS
+    assert response.num_bytes_downloaded == len(body)
+
+
+@pytest.mark.asyncio
+async def test_transport_rejects_oversized_responses():
+    """Test that oversized responses are rejected by announced and streamed size."""
+    body = json.dumps(ROWS).encode()
+
+    def announced(request):
+        return httpx.Response(200, content=body)
+
+    async def chunked():
+        for i in range(0, len(body), 1024):
+            yield body[i:i + 1024]
+
+    def streamed(request):
+        return httpx.Response(200, content=chunked())
+
+    for handler in (announced, streamed):
+        transport = make_transport(handler, 4096)
+        with pytest.raises(MemoryLimitExceeded, match="exceeds the limit of 4096 bytes"):
+            await transport.get("https://matomo.example.com/index.php", {}, {}, 5.0)
+        assert transport.rejected == 1
@@ -0,0 +1,133 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from matomo_mcp.cache import ResponseCache
+from matomo_mcp.client import MatomoClient
+from matomo_mcp.memory import estimate_size
+from matomo_mcp.models import (
+    ActionTable,
+    CountryTable,
+    ReportTable,
+    VisitsSummary,
+    to_json,
+    to_model,
+)
+from matomo_mcp.output import format_result
+
+PAGES = [
+    {"label": "/index", "url": "https://example.com/", "nb_visits": 30, "nb_hits": 50,
+     "bounce_rate": "40%"},
+    {"label": "/blog", "nb_visits": 50, "nb_hits": 60, "bounce_rate": "20%", "idsubdatatable": 3},
+    {"label": "/about", "url": "https://example.com/about", "nb_visits": 20, "nb_hits": 20,
+     "bounce_rate": "75%"},
+]
+
+SUMMARY = {
+    "nb_uniq_visitors": 80, "nb_users": 0, "nb_visits": 100, "nb_actions": 250,
+    "nb_visits_converted": 4, "bounce_count": 45, "sum_visit_length": 9000,
+    "max_actions": 12, "bounce_rate": "45%", "nb_actions_per_visit": 2.5,
+    "avg_time_on_site": 90, "custom_metric": 1,
+}
+
+
+def test_table_round_trip():
+    """Test that rows are restored exactly, including columns only some rows have."""
+    table = ReportTable.from_rows(PAGES)
+
+    assert len(table) == 3
+    assert table.to_rows() == PAGES
+    assert list(table) == PAGES
+    assert ReportTable.from_rows({"nb_visits": 1}) is None
+
+
+def test_typed_columns():
+    """Test column access by name, with None where a row lacks the column."""
+    table = ActionTable.from_rows(PAGES)
+
+    assert table.label == ["/index", "/blog", "/about"]
+    assert table.url == ["https://example.com/", None, "https://example.com/about"]
+    assert table.numbers("bounce_rate") == [40.0, 20.0, 75.0]
+
+
+def test_columns_are_copies():
+    """Test that modifying a returned column leaves the table unchanged."""
+    table = ActionTable.from_rows(PAGES)
+
+    table.label.append("/extra")
+    table.column("nb_hits")[0] = 0
+
+    assert table.label == ["/index", "/blog", "/about"]
+    assert table.to_rows() == PAGES
+
+
+def test_sort_filter_aggregate():
+    """Test column-wise sorting, filtering and totals."""
+    table = ActionTable.from_rows(PAGES)
+
+    assert table.sort("nb_visits").label == ["/blog", "/index", "/about"]
+    assert table.sort("bounce_rate", descending=False).top(1).label == ["/blog"]
+    assert table.filter("bounce_rate", minimum=30).label == ["/index", "/about"]
+    assert table.where("label", lambda label: label.startswith("/b")).nb_hits == [60]
+    assert table.sum("nb_hits") == 130
+    assert table.totals() == {"nb_visits": 100, "nb_hits": 130}
+    assert isinstance(table.sort("nb_hits"), ActionTable)
+    # Tables are never modified in place, so their accounted size stays the same
+    assert table.to_rows() == PAGES
+    assert estimate_size(table) == estimate_size(ActionTable.from_rows(PAGES))
+
+
+def test_visits_summary_model():
+    """Test the slot-based visits summary."""
+    summary = VisitsSummary.from_dict(SUMMARY)
+
+    assert summary.nb_visits == 100
+    assert summary.metric("bounce_rate") == 45.0
+    assert summary.metric("custom_metric") == 1
+    assert summary.to_dict() == SUMMARY
+    assert not hasattr(summary, "__dict__")
+
+
+def test_visits_summary_keeps_key_order():
+    """Test that Matomo's key order survives the round trip, plugin metrics included."""
+    data = {"nb_visits": 100, "custom_metric": 1, "nb_uniq_visitors": 80, "bounce_rate": "45%"}
+    assert list(VisitsSummary.from_dict(data).to_dict()) == list(data)
+
+
+def test_to_model():
+    """Test that responses are converted by method and shape."""
+    assert isinstance(to_model("UserCountry.getCountry", []), CountryTable)
+    assert isinstance(to_model("Actions.getPageUrls", PAGES), ActionTable)
+
+    by_day = to_model("VisitsSummary.get", {"2024-01-01": SUMMARY, "2024-01-02": []})
+    assert isinstance(by_day["2024-01-01"], VisitsSummary)
+    assert json.loads(json.dumps(by_day, default=to_json)) == {"2024-01-01": SUMMARY, "2024-01-02": []}
+
+
+def test_format_result_summarizes_tables():
+    """Test that tables are summarized like row lists."""
+    table = ActionTable.from_rows(PAGES)
+
+    assert json.loads(format_result(table)) == PAGES
+    assert format_result(table, max_rows=2) == format_result(PAGES, max_rows=2)
+    summary = json.loads(format_result(table, max_rows=2))
+    assert [row["label"] for row in summary["rows"]] == ["/blog", "/index"]
+    assert summary["totals"] == {"nb_visits": 100, "nb_hits": 130}
+
+
+@pytest.mark.asyncio
+async def test_typed_client_shares_cached_table(make_response):
+    """Test that typed results are served from the cache without copying."""
+    client = MatomoClient("https://matomo.example.com", "test_token_123", cache=ResponseCache())
+
+    with patch("httpx.AsyncClient.get") as mock_get:
+        mock_get.return_value = make_response(PAGES)
+        first = await client.get_page_urls(1, typed=True)
+        second = await client.get_page_urls(1, typed=True)
+        rows = await client.get_page_urls(1)
+
+    assert mock_get.call_count == 1
+    assert isinstance(first, ActionTable)
+    assert first.columns is second.columns
+    assert rows == PAGES
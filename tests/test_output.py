@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from matomo_mcp.models import to_model
+from matomo_mcp.output import decode_cursor, extract_rows, format_result
+
+
+@pytest.fixture
+def rows():
+    return [
+        {"label": f"/page-{i}", "nb_visits": i, "nb_hits": 2 * i, "bounce_rate": "10%"}
+        for i in range(1, 51)
+    ]
+
+
+def test_result_within_budget_is_unchanged(rows):
+    """Test that small results are returned verbatim."""
+    text = format_result(rows[:3], max_bytes=10000, max_rows=10)
+    assert json.loads(text) == rows[:3]
+
+
+def test_row_limit_returns_top_rows_and_totals(rows):
+    """Test that too many rows are summarized by the main metric."""
+    summary = json.loads(format_result(rows, max_rows=5))
+
+    assert summary["summary"] is True
+    assert summary["row_count"] == 50
+    assert summary["sort_by"] == "nb_visits"
+    assert [r["nb_visits"] for r in summary["rows"]] == [50, 49, 48, 47, 46]
+    assert summary["totals"] == {"nb_visits": 1275, "nb_hits": 2550}
+
+
+def test_cursor_continues_after_returned_rows(rows):
+    """Test that the continuation cursor returns the next page."""
+    first = json.loads(format_result(rows, max_rows=5, sort_by="nb_hits"))
+    second = json.loads(format_result(rows, max_rows=5, cursor=first["next_cursor"]))
+
+    assert decode_cursor(first["next_cursor"]) == {"offset": 5, "sort_by": "nb_hits"}
+    assert second["offset"] == 5
+    assert [r["nb_hits"] for r in second["rows"]] == [90, 88, 86, 84, 82]
+
+
+def test_byte_budget_bounds_output(rows):
+    """Test that the output stays within the byte budget."""
+    text = format_result(rows, max_bytes=1500)
+    summary = json.loads(text)
+
+    assert len(text.encode()) <= 1500
+    assert 0 < summary["returned_rows"] < 50
+
+
+def test_non_tabular_result_is_truncated():
+    """Test that results without rows are cut off at the byte budget."""
+    text = format_result({"description": "x" * 5000}, max_bytes=100)
+    assert "[truncated" in text
+    assert len(text) < 200
+
+
+def test_extract_rows_from_multi_period_report():
+    """Test that reports keyed by date are flattened with their key."""
+    result = {"2024-01-01": {"nb_visits": 1}, "2024-01-02": {"nb_visits": 2}}
+    assert extract_rows(result) == [
+        {"key": "2024-01-01", "nb_visits": 1},
+        {"key": "2024-01-02", "nb_visits": 2},
+    ]
+
+
+def test_totals_skip_ratio_metrics():
+    """Test that ratios and averages are not summed across periods."""
+    result = {
+        "2024-01-01": {"nb_visits": 10, "nb_actions_per_visit": 2.5, "avg_time_on_site": 60},
+        "2024-01-02": {"nb_visits": 20, "nb_actions_per_visit": 1.5, "avg_time_on_site": 30},
+    }
+    summary = json.loads(format_result(result, max_rows=1))
+    assert summary["totals"] == {"nb_visits": 30}
+
+
+def test_multi_period_report_with_empty_periods_is_summarized():
+    """Test that periods without data ([]) do not make a report non-tabular."""
+    result = {
+        f"2024-01-{day:02d}": {"nb_visits": day, "nb_actions": 2 * day} if day % 3 else []
+        for day in range(1, 31)
+    }
+    rows = extract_rows(result)
+    assert rows[2] == {"key": "2024-01-03"}
+    assert extract_rows(to_model("VisitsSummary.get", result)) == rows
+
+    summary = json.loads(format_result(result, max_rows=5))
+    assert [row["key"] for row in summary["rows"]] == [
+        "2024-01-29", "2024-01-28", "2024-01-26", "2024-01-25", "2024-01-23"
+    ]
+    assert summary["totals"]["nb_visits"] == sum(d for d in range(1, 31) if d % 3)
+    assert summary["next_cursor"]
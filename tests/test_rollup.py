@@ -0,0 +1,140 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from matomo_mcp.client import MatomoClient
+from matomo_mcp.rollup import Rollup, RollupStore, split_days
+
+SITES = [
+    {"idsite": "1", "name": "Main", "timezone": "UTC", "ts_created": "2024-03-01 00:00:00"},
+    {"idsite": "2", "name": "Shop", "timezone": "UTC", "ts_created": "2024-03-10 00:00:00"},
+]
+
+
+def make_rollup(visits_by_site, refetch_days=0):
+    """Create a rollup whose client answers from ``visits_by_site``."""
+    client = MatomoClient("https://matomo.example.com", "test_token_123")
+    calls = []
+
+    async def fake_call_api(method, params=None, use_cache=True):
+        assert method == "SitesManager.getSitesWithAtLeastViewAccess"
+        return SITES
+
+    async def fake_bulk_request(requests, use_cache=True):
+        calls.append(requests)
+        results = []
+        for method, params in requests:
+            assert method == "VisitsSummary.get"
+            visits = visits_by_site[params["idSite"]]
+            if params["date"] == "today":
+                results.append({"nb_visits": visits, "bounce_count": 0})
+                continue
+            first, last = params["date"].split(",")
+            results.append({
+                day: {"nb_visits": visits, "bounce_count": 1} if day >= "2024-03-10" else []
+                for day in (f"2024-03-{d:02d}" for d in range(int(first[-2:]), int(last[-2:]) + 1))
+            })
+        return results
+
+    client.call_api = fake_call_api
+    client.bulk_request = fake_bulk_request
+    rollup = Rollup(
+        client, RollupStore(":memory:"), reports=["visits"], refetch_days=refetch_days, chunk_size=1
+    )
+    return rollup, calls
+
+
+def test_split_days():
+    """Test that long ranges are split into bounded requests."""
+    start = datetime(2024, 1, 1).date()
+    end = datetime(2024, 1, 10).date()
+    assert [(a.day, b.day) for a, b in split_days(start, end, 4)] == [(1, 4), (5, 8), (9, 10)]
+
+
+@pytest.mark.asyncio
+async def test_sync_fetches_only_new_days():
+    """Test that a second sync only requests the days completed since the first."""
+    rollup, calls = make_rollup({1: 10, 2: 5})
+
+    stats = await rollup.sync(now=datetime(2024, 3, 15, 12, tzinfo=timezone.utc))
+    assert stats == {"sites": 2, "requests": 2, "days": 19, "rows": 10}
+    assert [r[0][1]["date"] for r in calls] == ["2024-03-01,2024-03-14", "2024-03-10,2024-03-14"]
+
+    calls.clear()
+    stats = await rollup.sync(now=datetime(2024, 3, 17, 12, tzinfo=timezone.utc))
+    assert stats["rows"] == 4
+    assert [r[0][1]["date"] for r in calls] == ["2024-03-15,2024-03-16", "2024-03-15,2024-03-16"]
+
+    calls.clear()
+    stats = await rollup.sync(now=datetime(2024, 3, 17, 18, tzinfo=timezone.utc))
+    assert stats["requests"] == 0
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_sync_refetches_trailing_days():
+    """Test that days archived before they were complete are corrected by the next sync."""
+    visits = {1: 10, 2: 5}
+    rollup, calls = make_rollup(visits, refetch_days=2)
+    await rollup.sync(now=datetime(2024, 3, 15, 0, 5, tzinfo=timezone.utc))
+
+    # The archive of 2024-03-14 is complete now
+    visits[1] = 12
+    calls.clear()
+    stats = await rollup.sync(now=datetime(2024, 3, 15, 6, tzinfo=timezone.utc))
+    assert [r[0][1]["date"] for r in calls] == ["2024-03-13,2024-03-14", "2024-03-13,2024-03-14"]
+    assert stats["days"] == 4
+
+    result = await rollup.query(
+        granularity="day", date="2024-03-14", group_by="site", include_today=False
+    )
+    assert result["rows"][0] == {"site": 1, "name": "Main", "nb_visits": 12}
+
+
+@pytest.mark.asyncio
+async def test_query_rollups_and_rankings():
+    """Test totals per period and site rankings from the store."""
+    rollup, _ = make_rollup({1: 10, 2: 5})
+    await rollup.sync(now=datetime(2024, 3, 15, 12, tzinfo=timezone.utc))
+
+    result = await rollup.query(
+        metrics=["nb_visits", "bounce_rate"],
+        granularity="week",
+        date="2024-03-01,2024-03-14",
+        include_today=False
+    )
+    assert result["synced_until"] == "2024-03-14"
+    assert result["rows"] == [
+        {"period": "2024-03-04", "nb_visits": 15, "bounce_rate": 13.33},
+        {"period": "2024-03-11", "nb_visits": 60, "bounce_rate": 13.33},
+    ]
+
+    ranking = await rollup.query(
+        granularity="day", date="2024-03-01,2024-03-14", group_by="site", include_today=False
+    )
+    assert ranking["rows"] == [
+        {"site": 1, "name": "Main", "nb_visits": 50},
+        {"site": 2, "name": "Shop", "nb_visits": 25},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_query_fetches_today_live():
+    """Test that today is added from live calls."""
+    rollup, calls = make_rollup({1: 10, 2: 5})
+    await rollup.sync(now=datetime(2024, 3, 15, 12, tzinfo=timezone.utc))
+    calls.clear()
+
+    result = await rollup.query(granularity="day", date="today", group_by="site")
+
+    assert result["live_sites"] == 2
+    assert [row["nb_visits"] for row in result["rows"]] == [10, 5]
+    assert all(r[0][1]["date"] == "today" for r in calls)
+
+
+@pytest.mark.asyncio
+async def test_query_rejects_unknown_metric():
+    """Test that metrics which cannot be rolled up are rejected."""
+    rollup, _ = make_rollup({1: 10, 2: 5})
+    with pytest.raises(ValueError, match="Unknown rollup metric"):
+        await rollup.query(metrics=["nb_uniq_visitors"])
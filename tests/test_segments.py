@@ -0,0 +1,123 @@
+from unittest.mock import patch
+
+import pytest
+
+from matomo_mcp.cache import ResponseCache
+from matomo_mcp.client import MatomoClient
+from matomo_mcp.segments import SegmentRegistry, canonicalize_segment
+
+
+def test_canonicalize_segment_order_and_whitespace():
+    """Test that equivalent segments share one canonical form."""
+    a = canonicalize_segment("deviceType==smartphone; browserName==Chrome")
+    b = canonicalize_segment("browserName==Chrome;deviceType==smartphone")
+    assert a == b == "browserName==Chrome;deviceType==smartphone"
+
+
+def test_canonicalize_segment_or_groups_and_encoding():
+    """Test that OR terms are sorted and values encoded consistently."""
+    a = canonicalize_segment("pageUrl=@/blog,countryCode==de")
+    b = canonicalize_segment("countryCode==de,pageUrl=@%2Fblog")
+    assert a == b == "countryCode==de,pageUrl=@%2Fblog"
+
+
+def test_canonicalize_segment_empty_and_invalid():
+    """Test empty segments and unparsable conditions."""
+    assert canonicalize_segment(None) is None
+    assert canonicalize_segment("  ") is None
+    with pytest.raises(ValueError, match="Invalid segment condition"):
+        canonicalize_segment("browserName")
+
+
+@pytest.mark.asyncio
+async def test_equivalent_segments_share_cache_entry(make_response):
+    """Test that a reordered segment is answered from the cache."""
+    registry = SegmentRegistry()
+    client = MatomoClient(
+        "https://matomo.example.com",
+        "test_token_123",
+        cache=ResponseCache(),
+        segments=registry
+    )
+
+    async def fake_get(url, params, headers, timeout):
+        if params["method"] == "SegmentEditor.getAll":
+            return make_response([])
+        return make_response({"nb_visits": 5})
+
+    with patch("httpx.AsyncClient.get", side_effect=fake_get) as mock_get:
+        await client.call_api("VisitsSummary.get", {
+            "idSite": 1, "segment": "browserName==Chrome;deviceType==desktop"
+        })
+        result = await client.call_api("VisitsSummary.get", {
+            "segment": "deviceType==desktop;browserName==Chrome", "idSite": 1
+        })
+
+        assert result == {"nb_visits": 5}
+        methods = [call.kwargs["params"]["method"] for call in mock_get.call_args_list]
+        assert methods == ["SegmentEditor.getAll", "VisitsSummary.get"]
+
+    stats = registry.stats()
+    assert len(stats) == 1
+    assert stats[0]["uses"] == 2
+    assert stats[0]["cache_hits"] == 1
+    assert stats[0]["cache_misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_segment_is_sent_as_stored(make_response):
+    """Test that Matomo receives a stored segment's exact spelling, or the caller's."""
+    client = MatomoClient(
+        "https://matomo.example.com",
+        "test_token_123",
+        cache=ResponseCache(),
+        segments=SegmentRegistry()
+    )
+    stored = [{"idsegment": 1, "definition": "deviceType==smartphone;browserName==Chrome"}]
+
+    async def fake_get(url, params, headers, timeout):
+        if params["method"] == "SegmentEditor.getAll":
+            return make_response(stored)
+        return make_response({"nb_visits": 5})
+
+    with patch("httpx.AsyncClient.get", side_effect=fake_get) as mock_get:
+        await client.call_api("VisitsSummary.get", {
+            "idSite": 1, "segment": "browserName==Chrome; deviceType==smartphone"
+        })
+        await client.call_api("VisitsSummary.get", {
+            "idSite": 1, "segment": "deviceType==tablet;browserName==Chrome"
+        })
+
+    sent = [call.kwargs["params"].get("segment") for call in mock_get.call_args_list]
+    assert sent == [
+        None,
+        "deviceType==smartphone;browserName==Chrome",
+        "deviceType==tablet;browserName==Chrome",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_frequent_segment_is_registered():
+    """Test that a frequently used segment is added with auto-archiving."""
+    registry = SegmentRegistry(auto_register=True, register_after=2)
+    client = MatomoClient("https://matomo.example.com", "test_token_123", segments=registry)
+    client_calls = []
+
+    async def fake_call_api(method, params=None):
+        client_calls.append((method, params))
+        return []
+
+    stats = registry.record("browserName==Chrome", 1, False)
+    registry.schedule_registration(client, stats, 1)
+    stats = registry.record("browserName==Chrome", 1, False)
+
+    with patch.object(client, "call_api", side_effect=fake_call_api):
+        registry.schedule_registration(client, stats, 1)
+        registry.schedule_registration(client, stats, 1)
+        for task in list(registry._pending):
+            await task
+
+    methods = [method for method, _ in client_calls]
+    assert methods == ["SegmentEditor.getAll", "SegmentEditor.add"]
+    assert client_calls[1][1]["autoArchive"] == 1
+    assert stats.registered_sites == {"1"}
@@ -0,0 +1,54 @@
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_report_level_is_not_expanded(cached_matomo_client, make_response):
+    """Test that the top level is requested without expanding subtables."""
+    rows = [{"label": "blog", "nb_hits": 10, "idsubdatatable": 5}]
+
+    with patch("httpx.AsyncClient.get") as mock_get:
+        mock_get.return_value = make_response(rows)
+
+        result = await cached_matomo_client.get_report_level("Actions.getPageUrls", 1)
+
+        params = mock_get.call_args.kwargs["params"]
+        assert params["expanded"] == 0
+        assert result == rows
+
+
+@pytest.mark.asyncio
+async def test_subtables_are_batched_and_cached_individually(cached_matomo_client, make_response):
+    """Test that uncached subtables are fetched together and reused one by one."""
+    with patch("httpx.AsyncClient.get") as mock_get:
+        mock_get.return_value = make_response([[{"label": "/a"}], [{"label": "/b"}]])
+        first = await cached_matomo_client.get_subtables("Actions.getPageUrls", 1, [5, 7])
+
+        params = mock_get.call_args.kwargs["params"]
+        assert params["method"] == "API.getBulkRequest"
+        assert parse_qs(params["urls[1]"])["idSubtable"] == ["7"]
+
+        mock_get.return_value = make_response([[{"label": "/c"}]])
+        second = await cached_matomo_client.get_subtables("Actions.getPageUrls", 1, [7, 9])
+
+        params = mock_get.call_args.kwargs["params"]
+        assert "urls[1]" not in params
+        assert parse_qs(params["urls[0]"])["idSubtable"] == ["9"]
+        assert mock_get.call_count == 2
+
+    assert first == {"5": [{"label": "/a"}], "7": [{"label": "/b"}]}
+    assert second == {"7": [{"label": "/b"}], "9": [{"label": "/c"}]}
+
+
+@pytest.mark.asyncio
+async def test_referrer_subtables_use_their_own_method(cached_matomo_client, make_response):
+    """Test that referrer reports load subtables through the matching method."""
+    with patch("httpx.AsyncClient.get") as mock_get:
+        mock_get.return_value = make_response([[{"label": "example.com/page"}]])
+
+        await cached_matomo_client.get_subtables("Referrers.getWebsites", 1, [3])
+
+        url = parse_qs(mock_get.call_args.kwargs["params"]["urls[0]"])
+        assert url["method"] == ["Referrers.getUrlsFromWebsiteId"]
@@ -0,0 +1,101 @@
+import json
+import time
+
+import pytest
+
+import matomo_mcp.server as server
+from matomo_mcp.client import MatomoClient
+from matomo_mcp.transport import RecordingTransport, ReplayTransport
+
+
+@pytest.fixture
+def cassette(tmp_path, make_static_transport):
+    """Provide a cassette path and a transport serving a fixed report."""
+    path = tmp_path / "cassette.jsonl"
+    inner = make_static_transport({"nb_visits": 42})
+    return path, inner
+
+
+@pytest.mark.asyncio
+async def test_recording_omits_token(cassette):
+    """Test that recorded interactions do not contain the API token."""
+    path, inner = cassette
+    client = MatomoClient(
+        "https://matomo.example.com",
+        "secret_token",
+        transport=RecordingTransport(inner, str(path))
+    )
+
+    await client.get_visits_summary(1, "day", "yesterday")
+
+    interaction = json.loads(path.read_text().splitlines()[0])
+    assert "secret_token" not in path.read_text()
+    assert interaction["request"]["method"] == "VisitsSummary.get"
+    assert interaction["response"]["status_code"] == 200
+
+
+@pytest.mark.asyncio
+async def test_replay_returns_recorded_response(cassette):
+    """Test that a replayed cassette answers without the original transport."""
+    path, inner = cassette
+    recorder = MatomoClient(
+        "https://matomo.example.com",
+        "secret_token",
+        transport=RecordingTransport(inner, str(path))
+    )
+    await recorder.get_visits_summary(1, "day", "yesterday")
+
+    replayer = ReplayTransport(str(path), speed=0)
+    client = MatomoClient("https://other.example.com", "other_token", transport=replayer)
+
+    assert await client.get_visits_summary(1, "day", "yesterday") == {"nb_visits": 42}
+    assert await client.get_visits_summary(1, "day", "yesterday") == {"nb_visits": 42}
+    assert replayer.requests == 2
+    assert inner.calls == 1
+
+    with pytest.raises(LookupError, match="No recorded response"):
+        await client.get_visits_summary(2, "day", "yesterday")
+
+
+@pytest.mark.asyncio
+async def test_replay_scales_timing(tmp_path):
+    """Test that recorded durations are divided by the replay speed."""
+    path = tmp_path / "slow.jsonl"
+    path.write_text(json.dumps({
+        "request": {"method": "API.getMatomoVersion", "module": "API", "format": "JSON"},
+        "response": {"status_code": 200, "headers": {}, "body": "IjUuMC4wIg=="},
+        "elapsed": 2.0,
+    }) + "\n")
+
+    client = MatomoClient(
+        "https://matomo.example.com",
+        "token",
+        transport=ReplayTransport(str(path), speed=100)
+    )
+
+    started = time.monotonic()
+    assert await client.call_api("API.getMatomoVersion") == "5.0.0"
+    assert 0.015 <= time.monotonic() - started < 1.0
+
+
+@pytest.mark.asyncio
+async def test_call_tool_offline_with_replay(cassette, monkeypatch):
+    """Test the full tool pipeline against a replayed cassette."""
+    path, inner = cassette
+    recorder = MatomoClient(
+        "https://matomo.example.com",
+        "secret_token",
+        transport=RecordingTransport(inner, str(path))
+    )
+    await recorder.get_visits_summary(3, "month", "2024-01-01")
+
+    monkeypatch.delenv("MATOMO_URL", raising=False)
+    monkeypatch.delenv("MATOMO_TOKEN", raising=False)
+    monkeypatch.setenv("MATOMO_REPLAY", str(path))
+    monkeypatch.setenv("MATOMO_REPLAY_SPEED", "0")
+    monkeypatch.setattr(server, "matomo_client", None)
+
+    result = await server.call_tool(
+        "get_visits_summary", {"site_id": 3, "period": "month", "date": "2024-01-01"}
+    )
+    assert json.loads(result[0].text) == {"nb_visits": 42}